@@ -0,0 +1,159 @@
+import hashlib
+import os
+import re
+from html.parser import HTMLParser
+from typing import List, NamedTuple, Tuple
+
+# prompt budget for the acceptance criteria section (~4 characters per token)
+AC_TOKEN_BUDGET = int(os.getenv("AC_TOKEN_BUDGET", "3000"))
+
+# (testing hint, trigger keywords) - one pass over the text finds every hint
+FIELD_TYPE_RULES: List[Tuple[str, Tuple[str, ...]]] = [
+    ("email validation", ("email", "mail")),
+    ("password requirements", ("password", "secret")),
+    ("date/time validation", ("date", "time")),
+    ("numeric boundaries", ("number", "price", "amount")),
+]
+
+_BLOCK_TAGS = {
+    "p", "div", "br", "li", "ul", "ol", "tr", "table", "section",
+    "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre",
+}
+_SKIP_TAGS = {"script", "style", "head"}
+
+_QUOTE_TRANSLATION = str.maketrans({
+    chr(8216): "'", chr(8217): "'",
+    chr(8220): '"', chr(8221): '"',
+    chr(160): " ",
+})
+_QUOTED_RE = re.compile(r'"([^"]+)"')
+_INLINE_SPACE_RE = re.compile(r"[ \t\f\v]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_SCENARIO_SPLIT_RE = re.compile(r"(?=Scenario:)")
+
+
+class _TextExtractor(HTMLParser):
+    """Collects the text of an Azure Boards HTML field, one line per block element."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+class PreprocessedCriteria(NamedTuple):
+    text: str
+    scenarios: List[str]
+    field_types: List[str]
+    raw_bytes: int
+    clean_bytes: int
+    truncated: bool
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.raw_bytes - self.clean_bytes
+
+
+def compile_field_rules(rules: List[Tuple[str, Tuple[str, ...]]]):
+    """Builds one alternation regex whose group index maps back to the rule."""
+    pattern = "|".join(
+        "(" + "|".join(re.escape(keyword) for keyword in keywords) + ")"
+        for _, keywords in rules
+    )
+    return re.compile(pattern, re.IGNORECASE), [hint for hint, _ in rules]
+
+
+_FIELD_RE, _FIELD_HINTS = compile_field_rules(FIELD_TYPE_RULES)
+
+
+def html_to_text(markup: str) -> str:
+    extractor = _TextExtractor()
+    extractor.feed(markup)
+    extractor.close()
+    return "".join(extractor.parts)
+
+
+def detect_field_types(text: str) -> List[str]:
+    found = set()
+    for match in _FIELD_RE.finditer(text):
+        found.add(match.lastindex - 1)
+        if len(found) == len(_FIELD_HINTS):
+            break
+    return [_FIELD_HINTS[i] for i in sorted(found)]
+
+
+def split_scenarios(text: str) -> List[str]:
+    scenarios = []
+    seen = set()
+    for scenario in _SCENARIO_SPLIT_RE.split(text):
+        scenario = scenario.strip()
+        # the same scenario pasted twice only costs tokens
+        if scenario and scenario not in seen:
+            seen.add(scenario)
+            scenarios.append(scenario)
+    return scenarios
+
+
+def scenario_hash(scenario: str) -> str:
+    """Content hash of one scenario; generated cases are tracked per hash."""
+    return hashlib.sha256(scenario.encode("utf-8")).hexdigest()[:16]
+
+
+def preprocess_acceptance(raw: str, token_budget: int = AC_TOKEN_BUDGET) -> PreprocessedCriteria:
+    """
+    HTML -> plain text, quote/whitespace normalisation, duplicate line and
+    scenario removal, field type detection and trimming to token_budget.
+    """
+    raw = raw or ""
+    text = html_to_text(raw).translate(_QUOTE_TRANSLATION)
+    text = _QUOTED_RE.sub(r"\1", text)
+
+    lines = []
+    previous = None
+    for line in text.split("\n"):
+        line = _INLINE_SPACE_RE.sub(" ", line).strip()
+        if line and line != previous:
+            lines.append(line)
+        previous = line or previous
+
+    scenarios = split_scenarios(_WHITESPACE_RE.sub(" ", " ".join(lines)))
+
+    max_chars = token_budget * 4
+    truncated = False
+    kept = []
+    used = 0
+    for scenario in scenarios:
+        if used + len(scenario) + 1 > max_chars:
+            truncated = True
+            if not kept:
+                kept.append(scenario[:max_chars])
+            break
+        kept.append(scenario)
+        used += len(scenario) + 1
+
+    text = " ".join(kept)
+
+    return PreprocessedCriteria(
+        text=text,
+        scenarios=kept,
+        field_types=detect_field_types(text),
+        raw_bytes=len(raw.encode("utf-8")),
+        clean_bytes=len(text.encode("utf-8")),
+        truncated=truncated,
+    )
@@ -0,0 +1,67 @@
+"""
+Asyncio counterparts of the public Azure DevOps and Gemini functions.
+
+Each coroutine runs the synchronous implementation on a dedicated worker
+pool so both APIs share the pooled sessions and the work item cache. At most
+ASYNC_CONCURRENCY calls are in flight at once, which keeps fan-out within
+the HTTP connection pool.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from Scripts import azure_client, gemini_client, test_management, testcase_creator
+from Scripts.http_client import HTTP_POOL_SIZE
+
+ASYNC_CONCURRENCY = int(os.getenv("ASYNC_CONCURRENCY", str(HTTP_POOL_SIZE)))
+
+_executor = ThreadPoolExecutor(max_workers=ASYNC_CONCURRENCY, thread_name_prefix="async-client")
+
+
+async def _run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # run_in_executor does not carry context variables (the current project) over
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+# ================================
+# AZURE BOARDS
+# ================================
+async def get_recent_user_stories(since):
+    return await _run(azure_client.get_recent_user_stories, since)
+
+
+async def get_work_item_raw(work_id):
+    return await _run(azure_client.get_work_item_raw, work_id)
+
+
+# ================================
+# TEST PLANS & SUITES
+# ================================
+async def get_or_create_test_plan(epic):
+    return await _run(test_management.get_or_create_test_plan, epic)
+
+
+async def get_suites(plan_id):
+    return await _run(test_management.get_suites, plan_id)
+
+
+# ================================
+# TEST CASES
+# ================================
+async def create_test_case_work_item(test_case):
+    return await _run(testcase_creator.create_test_case_work_item, test_case)
+
+
+async def link_test_to_suite(test_case_id, plan_id, suite_id):
+    return await _run(testcase_creator.link_test_to_suite, test_case_id, plan_id, suite_id)
+
+
+# ================================
+# GEMINI
+# ================================
+async def generate_test_cases(story):
+    return await _run(gemini_client.generate_test_cases, story)
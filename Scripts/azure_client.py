@@ -1,70 +1,197 @@
-import requests
-import os
-from datetime import datetime, timedelta
-
-ORG = os.getenv("AZURE_ORG")
-PROJECT = os.getenv("AZURE_PROJECT")
-PAT =   os.getenv("AZURE_PAT")                              #os.getenv("AZURE_PAT")
-
-AUTH = ("", PAT)
-
-from datetime import datetime, timedelta
-
-def get_recent_user_stories():
-
-    today = datetime.utcnow().strftime("%Y-%m-%d")
-
-    wiql = {
-        "query": f"""
-        SELECT [System.Id], [System.CreatedDate]
+from Scripts.http_client import ado_get, ado_post, project_url
+from Scripts.sync_state import parse_ado_date
+from Scripts.work_item_cache import work_item_cache
+
+# workitemsbatch accepts at most 200 ids per request
+BATCH_SIZE = 200
+# a flat WIQL query fails once it matches more work items than this
+WIQL_MAX_RESULTS = 20000
+
+
+def get_recent_user_stories(since):
+    """
+    User stories changed at or after `since` (an ISO-8601 UTC timestamp,
+    usually the sync watermark), oldest change first, and the WIQL asOf
+    timestamp: the watermark for the next sync, as stories fetched
+    afterwards may carry later changes than the query saw.
+    """
+
+    conditions = f"[System.WorkItemType] = 'User Story' AND [System.ChangedDate] >= '{since}'"
+
+    stories = []
+    as_of = None
+    # paged by id, so a delta beyond WIQL_MAX_RESULTS stories (a bulk edit, a
+    # long outage) is still listed; timePrecision compares the full timestamp
+    for ids, as_of in iter_work_item_id_pages(conditions, time_precision=True):
+        # one workitemsbatch call per 200 stories, relations included so the
+        # caller never has to fetch the raw story again
+        stories.extend(to_story(raw) for raw in get_work_items_batch(ids, expand="Relations"))
+
+    stories.sort(key=lambda story: parse_ado_date(story["raw"]["fields"]["System.ChangedDate"]))
+    return stories, as_of
+
+
+def iter_user_story_chunks(conditions, chunk_size=BATCH_SIZE, after_id=0, page_size=WIQL_MAX_RESULTS,
+                           time_precision=False):
+    """
+    Lists of up to chunk_size user stories (with relations) matching the
+    WIQL `conditions`, in id order after `after_id`. Only one page of ids
+    and one chunk of stories are held at a time.
+    """
+    chunk = []
+    for work_id in iter_work_item_ids(f"[System.WorkItemType] = 'User Story' AND ({conditions})",
+                                      after_id, page_size, time_precision):
+        chunk.append(work_id)
+        if len(chunk) == chunk_size:
+            stories = [to_story(raw) for raw in get_work_items_batch(chunk, expand="Relations")]
+            chunk = []
+            if stories:
+                yield stories
+    if chunk:
+        stories = [to_story(raw) for raw in get_work_items_batch(chunk, expand="Relations")]
+        if stories:
+            yield stories
+
+
+def iter_work_item_ids(conditions, after_id=0, page_size=WIQL_MAX_RESULTS, time_precision=False):
+    """
+    Ids of the work items matching the WIQL `conditions`, ascending, listed
+    page by page with iter_work_item_id_pages.
+    """
+    for ids, _ in iter_work_item_id_pages(conditions, after_id, page_size, time_precision):
+        yield from ids
+
+
+def iter_work_item_id_pages(conditions, after_id=0, page_size=WIQL_MAX_RESULTS, time_precision=False):
+    """
+    (ids, asOf) pages of the work items matching the WIQL `conditions`, in
+    ascending id order. Pages by id range ([System.Id] > last id of the
+    previous page, $top=page_size) so any number of matches can be listed
+    despite WIQL_MAX_RESULTS. Later pages are queried ASOF the first one's
+    asOf, so all pages describe the same moment.
+    """
+    page_size = min(page_size, WIQL_MAX_RESULTS)
+    last = int(after_id)
+    as_of = None
+    while True:
+        query = f"""
+        SELECT [System.Id]
         FROM WorkItems
         WHERE
-          [System.WorkItemType] = 'User Story'
-          AND [System.CreatedDate] >= '{today}'
+          ({conditions})
+          AND [System.Id] > {last}
+        ORDER BY [System.Id] ASC
         """
-    }
+        if as_of:
+            query += f"ASOF '{as_of}'"
+        result = run_wiql(query, time_precision, top=page_size)
+        as_of = as_of or result.get("asOf")
+        ids = [item["id"] for item in result.get("workItems", [])]
+        yield ids, as_of
+        if len(ids) < page_size:
+            return
+        last = ids[-1]
+
 
-    url = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/wit/wiql?api-version=7.0"
+def run_wiql(query, time_precision=False, top=None):
+    """Runs a WIQL query and returns the raw response (workItems or workItemRelations)."""
 
-    res = requests.post(url, json=wiql, auth=AUTH)
+    precision = "timePrecision=true&" if time_precision else ""
+    limit = f"$top={top}&" if top else ""
+    url = project_url(f"wit/wiql?{precision}{limit}api-version=7.0")
+
+    res = ado_post(url, json={"query": query})
 
     if res.status_code != 200:
         raise Exception(res.text)
 
-    items = res.json().get("workItems", [])
+    return res.json()
 
-    # Now filter by last hour manually
-    last_hour = datetime.utcnow() - timedelta(hours=1)
 
-    recent_stories = []
+def get_work_items_batch(ids, fields=None, expand=None):
+    """
+    Fetches work items in chunks of BATCH_SIZE through workitemsbatch.
+    Returns the raw work items in the order of `ids`, skipping ids that
+    no longer exist. Items already in the work item cache are not fetched.
+    """
+    url = project_url("wit/workitemsbatch?api-version=7.0")
 
-    for item in items:
-        work_item = get_work_item(item["id"])
-        recent_stories.append(work_item)
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    by_id = {}
 
-    return recent_stories
+    # cached items always carry relations, so they satisfy any projection
+    for work_id in ids:
+        cached = work_item_cache.get(work_id)
+        if cached is not None:
+            by_id[work_id] = cached
 
+    missing = [i for i in ids if i not in by_id]
+    # only full items with relations may enter the cache
+    cacheable = expand in ("Relations", "All")
 
+    for start in range(0, len(missing), BATCH_SIZE):
+        body = {"ids": missing[start:start + BATCH_SIZE], "errorPolicy": "Omit"}
+        # ADO rejects a field list combined with Relations/Fields/All expansion,
+        # so fields are only projected server side when nothing is expanded
+        if expand and expand not in ("None", "Links"):
+            body["$expand"] = expand
+        else:
+            if fields:
+                body["fields"] = fields
+            if expand:
+                body["$expand"] = expand
 
-def get_work_item(work_id):
+        res = ado_post(url, json=body)
 
-    url = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/wit/workitems/{work_id}?api-version=7.0"
+        if res.status_code != 200:
+            raise Exception(f"Work item batch fetch failed: {res.status_code} {res.text}")
 
-    res = requests.get(url, auth=AUTH)
+        for item in res.json().get("value", []):
+            # errorPolicy=Omit returns null for missing or deleted ids
+            if item:
+                by_id[item["id"]] = item
+                if cacheable:
+                    work_item_cache.put(item)
 
-    fields = res.json()["fields"]
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def to_story(work_item):
+    """
+    Builds the story dict used by the generator from a raw work item.
+    The raw item (with relations, when fetched) is kept under "raw".
+    """
+    fields = work_item.get("fields", {})
 
     return {
-        "id": work_id,
+        "id": work_item["id"],
         "title": fields.get("System.Title", ""),
         "description": fields.get("System.Description", ""),
-        "acceptance": fields.get("Microsoft.VSTS.Common.AcceptanceCriteria", "")
+        "acceptance": fields.get("Microsoft.VSTS.Common.AcceptanceCriteria", ""),
+        "raw": work_item,
     }
 
 
+def get_work_item(work_id):
+
+    story = to_story(get_work_item_raw(work_id))
+    story["id"] = work_id
+
+    return story
+
+
 def get_work_item_raw(work_id):
 
-    url = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/wit/workitems/{work_id}?$expand=relations&api-version=7.0"
-    res = requests.get(url, auth=AUTH)
+    cached = work_item_cache.get(work_id)
+    if cached is not None:
+        return cached
+
+    url = project_url(f"wit/workitems/{work_id}?$expand=relations&api-version=7.0")
+    res = ado_get(url)
+    if res.status_code != 200:
+        raise Exception(f"Fetching work item {work_id} failed: {res.status_code} {res.text}")
+
+    work_item = res.json()
+    work_item_cache.put(work_item)
 
-    return res.json()
\ No newline at end of file
+    return work_item
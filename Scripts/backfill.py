@@ -0,0 +1,206 @@
+import contextvars
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from Scripts.hierarchy_manager import get_child_ids
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# stories fetched, resolved and processed together; one workitemsbatch call at 200
+BACKFILL_CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", "200"))
+# ids per WIQL page ($top); WIQL itself refuses more than 20,000
+BACKFILL_PAGE_SIZE = int(os.getenv("BACKFILL_PAGE_SIZE", "5000"))
+# last finished story id per backfill scope, so an interrupted backfill resumes
+BACKFILL_STATE_DIR = os.getenv("BACKFILL_STATE_DIR", ".cache/backfill")
+
+
+def _quote(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+class BackfillScope(NamedTuple):
+    """
+    The user stories a backfill covers: those under an Epic, under an area
+    path and/or created in [created_from, created_to). Given filters are
+    combined with AND.
+    """
+
+    epic: Optional[int] = None
+    area_path: Optional[str] = None
+    created_from: Optional[str] = None
+    created_to: Optional[str] = None
+
+    def describe(self):
+        parts = []
+        if self.epic:
+            parts.append(f"epic {self.epic}")
+        if self.area_path:
+            parts.append(f"area path {self.area_path}")
+        if self.created_from or self.created_to:
+            parts.append(f"created {self.created_from or '...'} to {self.created_to or '...'}")
+        return ", ".join(parts)
+
+    @property
+    def time_precision(self):
+        return bool(self.created_from or self.created_to)
+
+    def conditions(self):
+        """
+        WIQL conditions selecting the scope's stories, or None when an Epic
+        has no Features. An Epic is resolved to its Features once, as flat
+        WIQL cannot filter on grandparents.
+        """
+        conditions = []
+        if self.epic:
+            feature_ids = get_child_ids([self.epic], "Feature")
+            if not feature_ids:
+                return None
+            conditions.append(f"[System.Parent] IN ({', '.join(str(i) for i in feature_ids)})")
+        if self.area_path:
+            conditions.append(f"[System.AreaPath] UNDER {_quote(self.area_path)}")
+        if self.created_from:
+            conditions.append(f"[System.CreatedDate] >= {_quote(self.created_from)}")
+        if self.created_to:
+            conditions.append(f"[System.CreatedDate] < {_quote(self.created_to)}")
+        if not conditions:
+            raise ValueError("a backfill needs an epic, an area path or a created date range")
+        return " AND ".join(conditions)
+
+
+class BackfillCheckpoint:
+    """
+    Last story id a backfill of one scope went through and the stories it
+    left unfinished (retried first on the next run), saved after every chunk.
+    """
+
+    def __init__(self, path, last_id=0, stories=0, unfinished=None):
+        self.path = path
+        self.last_id = last_id
+        self.stories = stories
+        self.unfinished = unfinished or []
+
+    @classmethod
+    def load(cls, scope, directory=BACKFILL_STATE_DIR):
+        key = hashlib.sha256(repr(tuple(scope)).encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(directory, f"{key}.json")
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(path, data.get("last_id", 0), data.get("stories", 0), data.get("unfinished"))
+
+    def advance(self, last_id, finished, unfinished):
+        """Records a chunk: the ids of its finished and of its unfinished stories."""
+        self.last_id = max(self.last_id, last_id)
+        self.stories += len(finished)
+        self.unfinished = sorted((set(self.unfinished) - set(finished)) | set(unfinished))
+        self._save()
+
+    def forget(self, story_ids):
+        """Stops retrying unfinished stories, e.g. ones deleted since."""
+        self.unfinished = sorted(set(self.unfinished) - set(story_ids))
+        self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"last_id": self.last_id, "stories": self.stories, "unfinished": self.unfinished}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Forgets the checkpoint; the next backfill of the scope starts over."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def prefetch(iterable, depth=1):
+    """
+    Iterates `iterable` in a background thread, at most `depth` items ahead
+    of the consumer, so the next chunk is fetched while this one is
+    processed without the pipeline ever holding more than depth + 1 chunks.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    context = contextvars.copy_context()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(("item", item)):
+                    return
+            put(("done", None))
+        except Exception as e:
+            put(("error", e))
+
+    threading.Thread(target=context.run, args=(produce,), name="backfill-prefetch", daemon=True).start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class BackfillProgress:
+    """Stories done and throughput of a running backfill, printed per chunk."""
+
+    def __init__(self, resumed=0):
+        self.started = time.perf_counter()
+        self.resumed = resumed
+        self.stories = 0
+        self.chunks = 0
+        self.last_id = None
+
+    def chunk_done(self, stories, last_id, seconds):
+        self.stories += stories
+        self.chunks += 1
+        self.last_id = last_id
+        elapsed = time.perf_counter() - self.started
+        print(f"backfill chunk {self.chunks}: {stories} stories in {seconds:.1f}s "
+              f"({stories * 60 / seconds if seconds else 0:.0f}/min); {self.resumed + self.stories} done, "
+              f"{self.stories * 60 / elapsed if elapsed else 0:.0f} stories/min overall, "
+              f"last id {last_id}, peak RSS {peak_rss_mb()} MB")
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "stories": self.stories,
+            "resumed_after": self.resumed,
+            "chunks": self.chunks,
+            "last_id": self.last_id,
+            "wall_seconds": round(elapsed, 3),
+            "stories_per_minute": round(self.stories * 60 / elapsed, 2) if elapsed else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
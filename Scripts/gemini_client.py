@@ -1,65 +1,124 @@
-import requests
-import re
+import contextvars
 import json
-import html
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-API_KEY = os.getenv("GEMINI_API_KEY")
+from Scripts.ac_preprocessor import detect_field_types, preprocess_acceptance, split_scenarios
+from Scripts.gemini_cache import gemini_cache
+from Scripts.http_client import gemini_post, gemini_url
+from Scripts.instrumentation import metrics
+from Scripts.model_router import GEMINI_MODEL, STRONG, estimate_tokens, model_router, route
+from Scripts.test_case_schema import BATCH_RESPONSE_SCHEMA, RESPONSE_SCHEMA, parse_test_case, parse_test_cases
+
+# bump whenever the prompt template changes so cached responses are not reused
+PROMPT_VERSION = "3"
+SCENARIO_PROMPT_VERSION = PROMPT_VERSION + "/scenario"
+
+# stream cases out of streamGenerateContent as soon as each one is complete
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "false").lower() == "true"
+
+# pack several stories into one request, up to this many prompt + output tokens
+GEMINI_BATCHING = os.getenv("GEMINI_BATCHING", "false").lower() == "true"
+GEMINI_BATCH_TOKEN_BUDGET = int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "12000"))
+GEMINI_BATCH_MAX_STORIES = int(os.getenv("GEMINI_BATCH_MAX_STORIES", "8"))
+# rough size of one story's generated test cases
+OUTPUT_TOKENS_PER_STORY = 1500
+
+# scenario prompts in flight at once when only changed scenarios are regenerated
+SCENARIO_WORKERS = int(os.getenv("SCENARIO_WORKERS", "4"))
 
 def clean_acceptance_criteria(text: str) -> str:
-    if not text:
-        return ""
-    text = html.unescape(text)
-    text = text.replace(chr(8216), "'").replace(chr(8217), "'")
-    text = text.replace(chr(8220), '"').replace(chr(8221), '"')
-    text = re.sub(r'"([^"]+)"', r'\1', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+    return preprocess_acceptance(text).text
+
+def prepare_acceptance(story):
+    """Preprocesses a story's acceptance criteria and reports the bytes saved."""
+    criteria = preprocess_acceptance(story["acceptance"])
+    note = " (trimmed to prompt budget)" if criteria.truncated else ""
+    print(f"acceptance criteria for story {story['id']}: {criteria.raw_bytes} -> {criteria.clean_bytes} bytes, "
+          f"{criteria.bytes_saved} saved{note}")
+    return criteria.text
 
 def format_acceptance_for_prompt(text: str) -> str:
-    scenarios = re.split(r'(?=Scenario:)', text)
-    out = ""
-    for s in scenarios:
-        s = s.strip()
-        if s:
-            out += f"- {s}\n"
-    return out
-
-def extract_json(text):
-    """Extract JSON array from response."""
-    # Try markdown code blocks first
-    match = re.search(r"```json\s*(\[[\s\S]*?\])\s*```", text, re.DOTALL)
-    if match:
-        cleaned = match.group(1).strip()
-    else:
-        # Try plain array
-        match = re.search(r"(\[[\s\S]*\])", text, re.DOTALL)
-        if not match:
-            raise ValueError("No JSON array found in response")
-        cleaned = match.group(1)
-    
-    # Clean up common issues
-    cleaned = cleaned.replace(",]", "]").replace(",}", "}")
-    cleaned = re.sub(r',\s*([}\]])', r'\1', cleaned)
-    
-    return json.loads(cleaned)
+    # numbered so each generated case can name the scenario it covers
+    return "".join(f"{n}. {s}\n" for n, s in enumerate(split_scenarios(text), start=1))
+
+class JsonArrayStream:
+    """
+    Incremental parser for a top-level JSON array arriving in chunks.
+    feed() returns the elements completed by the new text; anything before
+    the opening bracket is ignored.
+    """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.finished = False
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        items = []
+
+        if not self.started:
+            start = self.buffer.find("[", self.pos)
+            if start == -1:
+                self.pos = len(self.buffer)
+                return items
+            self.started = True
+            self.pos = start + 1
+
+        while not self.finished:
+            # skip separators (and stray trailing commas)
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n,":
+                self.pos += 1
+            if self.pos >= len(self.buffer):
+                break
+            if self.buffer[self.pos] == "]":
+                self.finished = True
+                break
+            try:
+                item, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # element not complete yet; wait for more text
+                break
+            # a bare number may still be growing; only accept it once followed by more text
+            if end >= len(self.buffer) and not isinstance(item, (dict, list, str)):
+                break
+            items.append(item)
+            self.pos = end
+
+        # drop consumed text so the buffer holds at most one partial element
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        return items
 
 def generate_test_cases(story):
-    cleaned = clean_acceptance_criteria(story["acceptance"])
+    cleaned = prepare_acceptance(story)
+    tier = route(cleaned)
+
+    cache_key = gemini_cache.make_key(cleaned, PROMPT_VERSION, tier.model)
+    cached = gemini_cache.get(cache_key)
+    if cached is not None:
+        print(f"AI response for story {story['id']} served from cache")
+        return parse_test_cases(cached)
+
+    return _generate_uncached(cleaned, tier, cache_key)
+
+def _generate_uncached(cleaned, tier, cache_key):
+    tests = parse_test_cases(json.loads(call_gemini(build_prompt(cleaned), RESPONSE_SCHEMA, tier)))
+    _cache_tests(cache_key, tier, tests)
+
+    return tests
+
+def _cache_tests(cache_key, tier, tests):
+    gemini_cache.put(cache_key, tier.model, [tc.to_json() for tc in tests])
+
+def build_prompt(cleaned):
     formatted = format_acceptance_for_prompt(cleaned)
-    
-    # Detect field types for contextual testing hints
-    field_types = []
-    if any(x in cleaned.lower() for x in ['email', 'mail']):
-        field_types.append("email validation")
-    if any(x in cleaned.lower() for x in ['password', 'secret']):
-        field_types.append("password requirements")
-    if any(x in cleaned.lower() for x in ['date', 'time']):
-        field_types.append("date/time validation")
-    if any(x in cleaned.lower() for x in ['number', 'price', 'amount']):
-        field_types.append("numeric boundaries")
-    
-    field_hint = f" Also test: {', '.join(field_types)}." if field_types else ""
+    field_hint = detect_field_hint(cleaned)
 
     prompt = f"""
 Generate 8-12 manual test cases for this user story. Include:
@@ -68,30 +127,255 @@ Generate 8-12 manual test cases for this user story. Include:
 **Negative (3-6):** Validation failures, invalid inputs
 **Edge (3-5):** Empty values, boundaries, special chars{field_hint}
 
-Return ONLY this JSON format (no markdown, no explanations):
-[
-  {{
-    "title": "Test case title",
-    "type": "positive|negative|edge",
-    "steps": ["Step 1", "Step 2"],
-    "expected": "Expected result"
-  }}
-]
+Give every step the action to perform and the result expected after it.
+Set scenario to the number of the acceptance criterion the case covers.
 
 Acceptance Criteria:
 {formatted}
 """
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={API_KEY}"
-    body = { "contents": [{"parts": [{"text": prompt}]}] }
+    return prompt
+
+def build_scenario_prompt(scenario):
+    return f"""
+Generate 2-5 manual test cases for this one acceptance criteria scenario of a user story, covering
+its happy path, invalid inputs and edge cases as they apply.{detect_field_hint(scenario)}
+
+Give every step the action to perform and the result expected after it. Set scenario to 1.
+
+Scenario:
+{scenario}
+"""
+
+def generate_scenario_test_cases(scenarios):
+    """
+    {scenario text: test cases} with one prompt per scenario, SCENARIO_WORKERS
+    at a time; used when only some of a story's scenarios changed.
+    """
+    if not scenarios:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(SCENARIO_WORKERS, len(scenarios)),
+                            thread_name_prefix="scenario") as executor:
+        # threads do not inherit context variables (the current project)
+        futures = {scenario: executor.submit(contextvars.copy_context().run, _generate_for_scenario, scenario)
+                   for scenario in scenarios}
+        return {scenario: future.result() for scenario, future in futures.items()}
+
+def _generate_for_scenario(scenario):
+    tier = route(scenario)
+    cache_key = gemini_cache.make_key(scenario, SCENARIO_PROMPT_VERSION, tier.model)
+    cached = gemini_cache.get(cache_key)
+    if cached is not None:
+        return parse_test_cases(cached)
+
+    tests = parse_test_cases(json.loads(call_gemini(build_scenario_prompt(scenario), RESPONSE_SCHEMA, tier)))
+    _cache_tests(cache_key, tier, tests)
+    return tests
+
+def detect_field_hint(cleaned):
+    # Detect field types for contextual testing hints
+    field_types = detect_field_types(cleaned)
+    return f" Also test: {', '.join(field_types)}." if field_types else ""
+
+BATCH_INSTRUCTIONS = """
+Generate 8-12 manual test cases for EACH user story below. For each story include:
 
-    res = requests.post(url, json=body)
+**Positive (2-8):** Happy path scenarios
+**Negative (3-6):** Validation failures, invalid inputs
+**Edge (3-5):** Empty values, boundaries, special chars, plus any extra areas listed for that story
+
+Give every step the action to perform and the result expected after it.
+Set scenario to the number of the story's acceptance criterion the case covers.
+Return one entry per story, with story_id set to the id in the story's heading.
+"""
+
+def build_batch_prompt(entries):
+    """entries: [(story_id, cleaned acceptance criteria), ...]"""
+    sections = [BATCH_INSTRUCTIONS]
+    for story_id, cleaned in entries:
+        sections.append(f"### Story {story_id}{detect_field_hint(cleaned)}\nAcceptance Criteria:\n{format_acceptance_for_prompt(cleaned)}")
+    return "\n".join(sections)
+
+def plan_batches(entries, token_budget=GEMINI_BATCH_TOKEN_BUDGET, max_stories=GEMINI_BATCH_MAX_STORIES):
+    """
+    Greedily groups (story_id, cleaned) entries so each request's prompt
+    plus expected output stays within token_budget.
+    """
+    batches = []
+    current = []
+    used = estimate_tokens(BATCH_INSTRUCTIONS)
+
+    for entry in entries:
+        cost = estimate_tokens(entry[1]) + OUTPUT_TOKENS_PER_STORY
+        if current and (used + cost > token_budget or len(current) >= max_stories):
+            batches.append(current)
+            current = []
+            used = estimate_tokens(BATCH_INSTRUCTIONS)
+        current.append(entry)
+        used += cost
+
+    if current:
+        batches.append(current)
+    return batches
+
+def generate_test_cases_batch(stories, token_budget=GEMINI_BATCH_TOKEN_BUDGET):
+    """
+    Generates test cases for several stories with as few Gemini requests as
+    the token budget allows; stories are only batched with others routed to
+    the same model tier. Returns {story_id: test cases}. Stories missing
+    from, or malformed in, a batch response are retried one at a time.
+    """
+    results = {}
+    entries_by_tier = {}
+    by_id = {}
+
+    for story in stories:
+        cleaned = prepare_acceptance(story)
+        tier = route(cleaned)
+        cached = gemini_cache.get(gemini_cache.make_key(cleaned, PROMPT_VERSION, tier.model))
+        if cached is not None:
+            results[story["id"]] = parse_test_cases(cached)
+            continue
+        by_id[str(story["id"])] = story["id"]
+        entries_by_tier.setdefault(tier, []).append((str(story["id"]), cleaned))
+
+    for tier, entries in entries_by_tier.items():
+        for batch in plan_batches(entries, token_budget):
+            _generate_batch(tier, batch, by_id, results)
+
+    return results
+
+def _generate_batch(tier, batch, by_id, results):
+    if len(batch) == 1:
+        story_id, cleaned = batch[0]
+        results[by_id[story_id]] = _generate_uncached(cleaned, tier, gemini_cache.make_key(cleaned, PROMPT_VERSION, tier.model))
+        return
+
+    print(f"AI batch request ({tier.name} tier) for stories {[story_id for story_id, _ in batch]}")
+    try:
+        parsed = json.loads(call_gemini(build_batch_prompt(batch), BATCH_RESPONSE_SCHEMA, tier))
+        parsed = {str(entry["story_id"]): entry["test_cases"] for entry in parsed}
+    except (ValueError, RuntimeError, KeyError, TypeError) as e:
+        print(f"Malformed batch response, falling back to per-story requests: {e}")
+        parsed = {}
+
+    for story_id, cleaned in batch:
+        cache_key = gemini_cache.make_key(cleaned, PROMPT_VERSION, tier.model)
+        tests = parse_test_cases(parsed[story_id]) if isinstance(parsed.get(story_id), list) else None
+        if tests:
+            _cache_tests(cache_key, tier, tests)
+            results[by_id[story_id]] = tests
+        else:
+            results[by_id[story_id]] = _generate_uncached(cleaned, tier, cache_key)
+
+def request_body(prompt, schema=RESPONSE_SCHEMA):
+    """generateContent body asking for JSON that follows schema."""
+    return {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {"responseMimeType": "application/json", "responseSchema": schema},
+    }
+
+def call_gemini(prompt, schema=RESPONSE_SCHEMA, tier=STRONG):
+    """
+    Sends the prompt to the tier's model and returns the generated JSON
+    text; a slow call is hedged with a second request (see model_router).
+    """
+    return model_router.call(tier, lambda: _generate_content(tier.model, prompt, schema))
+
+def _generate_content(model, prompt, schema):
+    url = gemini_url(model)
+    body = request_body(prompt, schema)
+
+    res = gemini_post(url, json=body)
     print(f"AI response code: {res.status_code}")
 
     j = res.json()
+    metrics.record_gemini_usage(j.get("usageMetadata"))
     try:
         text = j["candidates"][0]["content"]["parts"][0]["text"]
     except (KeyError, IndexError) as e:
         raise RuntimeError(f"Unexpected Gemini response: {json.dumps(j)[:500]}") from e
 
-    return extract_json(text)
+    return text
+
+def generate_test_cases_stream(story):
+    """
+    Streaming variant of generate_test_cases: yields each test case as soon
+    as Gemini has finished producing it.
+    """
+    cleaned = prepare_acceptance(story)
+    tier = route(cleaned)
+
+    cache_key = gemini_cache.make_key(cleaned, PROMPT_VERSION, tier.model)
+    cached = gemini_cache.get(cache_key)
+    if cached is not None:
+        print(f"AI response for story {story['id']} served from cache")
+        yield from parse_test_cases(cached)
+        return
+
+    parser = JsonArrayStream()
+    tests = []
+    received = 0
+    # time spent waiting on Gemini, without the time the caller spends on each case
+    waited = 0.0
+
+    try:
+        started = time.perf_counter()
+        for chunk in stream_gemini(build_prompt(cleaned), tier.model):
+            waited += time.perf_counter() - started
+            for item in parser.feed(chunk):
+                received += 1
+                try:
+                    tc = parse_test_case(item)
+                except ValueError as e:
+                    print(f"Rejected generated test case #{received}: {e}")
+                    metrics.increment("test_cases_rejected")
+                    continue
+                tests.append(tc)
+                yield tc
+            started = time.perf_counter()
+        waited += time.perf_counter() - started
+    except Exception:
+        model_router.record(tier, waited, failed=True)
+        raise
+    model_router.record(tier, waited)
+
+    if not parser.finished:
+        # JSON mode never wraps the array, so an open one means the output was cut off
+        raise ValueError(f"Gemini stream for story {story['id']} ended inside the JSON array")
+
+    _cache_tests(cache_key, tier, tests)
+
+def stream_gemini(prompt, model=GEMINI_MODEL):
+    """
+    Sends the prompt to streamGenerateContent and yields text chunks.
+    Not hedged: cases are published while they stream in.
+    """
+    url = gemini_url(model, "streamGenerateContent") + "?alt=sse"
+    body = request_body(prompt)
+
+    with gemini_post(url, json=body, stream=True) as res:
+        print(f"AI response code: {res.status_code}")
+        if res.status_code != 200:
+            raise RuntimeError(f"Gemini streaming request failed: {res.status_code} {res.text[:500]}")
+
+        # SSE responses usually omit the charset
+        res.encoding = res.encoding or "utf-8"
+
+        usage = None
+        for line in res.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            j = json.loads(line[len("data:"):])
+            # usage is cumulative; the last event carries the totals
+            usage = j.get("usageMetadata") or usage
+            try:
+                parts = j["candidates"][0]["content"]["parts"]
+            except (KeyError, IndexError):
+                # usage-only or finish events carry no text
+                continue
+            for part in parts:
+                if part.get("text"):
+                    yield part["text"]
+
+        metrics.record_gemini_usage(usage)
@@ -1,4 +1,10 @@
-from Scripts.azure_client import get_work_item_raw
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from Scripts.azure_client import get_work_item_raw, get_work_items_batch, run_wiql
+
+HIERARCHY_REVERSE = "System.LinkTypes.Hierarchy-Reverse"
+HIERARCHY_FORWARD = "System.LinkTypes.Hierarchy-Forward"
+RELATED = "System.LinkTypes.Related"
 
 def get_parent(work_item,work_item_type=None):
 
@@ -26,8 +32,13 @@ def get_parent(work_item,work_item_type=None):
 def get_related_test_cases(work_item,relation_type=None):
 
     relations = work_item.get("relations", [])
-    print("the relations are "+str(relations))
     related_test_cases = []
+
+    # warm the work item cache with every related item in one batch call
+    if relation_type=="Related":
+        related_ids = [rel["url"].split("/")[-1] for rel in relations if "Related" in rel["rel"]]
+        get_work_items_batch(related_ids, expand="Relations")
+
     for rel in relations:
         if "Related" in rel["rel"]:
             #check if the new user story has related old user stories that might be 
@@ -38,7 +49,7 @@ def get_related_test_cases(work_item,relation_type=None):
                 print("the related id is "+str(related_id))
                 related_item_id = get_work_item_raw(related_id)
                 if related_item_id["fields"]["System.WorkItemType"]== "Test Case":
-                    print("the tc id related is found and it's id is "+str(related_item_id))
+                    print("the tc id related is found and it's id is "+str(related_item_id["id"]))
                     related_test_cases.append(related_item_id)
         
 
@@ -54,3 +65,89 @@ def get_feature_and_epic(story):
         epic = get_parent(feature, work_item_type="Feature")
 
     return feature, epic
+
+
+class StoryHierarchy(NamedTuple):
+    feature: Optional[Dict[str, Any]]
+    epic: Optional[Dict[str, Any]]
+    related_test_cases: List[Dict[str, Any]]
+
+
+# keeps each WorkItemLinks query well under the 32K character WIQL limit
+LINK_QUERY_CHUNK = 500
+
+
+def _query_links(source_ids, link_types, target_types):
+    """(link type, source id, target id) for every matching link of the sources."""
+    links = []
+    source_ids = list(dict.fromkeys(int(i) for i in source_ids))
+    link_list = ", ".join(f"'{t}'" for t in link_types)
+    type_list = ", ".join(f"'{t}'" for t in target_types)
+
+    for start in range(0, len(source_ids), LINK_QUERY_CHUNK):
+        id_list = ", ".join(str(i) for i in source_ids[start:start + LINK_QUERY_CHUNK])
+        query = f"""
+        SELECT [System.Id]
+        FROM WorkItemLinks
+        WHERE
+          ([Source].[System.Id] IN ({id_list}))
+          AND ([System.Links.LinkType] IN ({link_list}))
+          AND ([Target].[System.WorkItemType] IN ({type_list}))
+        MODE (MustContain)
+        """
+        for relation in run_wiql(query).get("workItemRelations", []):
+            # the first rows are the sources themselves with no link
+            if relation.get("rel") and relation.get("source"):
+                links.append((relation["rel"], relation["source"]["id"], relation["target"]["id"]))
+
+    return links
+
+
+def get_child_ids(parent_ids, work_item_type):
+    """Ids of the direct children of the given type, e.g. the Features of an Epic."""
+    links = _query_links(parent_ids, (HIERARCHY_FORWARD,), (work_item_type,)) if parent_ids else []
+    return list(dict.fromkeys(target for _, _, target in links))
+
+
+def resolve_hierarchy(story_ids):
+    """
+    Resolves Story -> Feature -> Epic and the Related Test Cases of many
+    stories with two WorkItemLinks queries plus batched fetches of the
+    linked items. Returns {story_id: StoryHierarchy}.
+    """
+    story_ids = [int(i) for i in story_ids]
+    if not story_ids:
+        return {}
+
+    story_links = _query_links(story_ids, (HIERARCHY_REVERSE, RELATED), ("Feature", "Test Case"))
+
+    targets = {item["id"]: item for item in get_work_items_batch([t for _, _, t in story_links], expand="Relations")}
+
+    features = {}
+    related = {story_id: [] for story_id in story_ids}
+    for rel, source, target in story_links:
+        item = targets.get(target)
+        if item is None:
+            continue
+        work_item_type = item["fields"]["System.WorkItemType"]
+        if rel == HIERARCHY_REVERSE and work_item_type == "Feature":
+            features.setdefault(source, item)
+        elif rel == RELATED and work_item_type == "Test Case":
+            related[source].append(item)
+
+    feature_ids = list(dict.fromkeys(feature["id"] for feature in features.values()))
+    epic_links = _query_links(feature_ids, (HIERARCHY_REVERSE,), ("Epic",)) if feature_ids else []
+    epic_items = {item["id"]: item for item in get_work_items_batch([t for _, _, t in epic_links], expand="Relations")}
+
+    epics = {}
+    for _, source, target in epic_links:
+        if target in epic_items:
+            epics.setdefault(source, epic_items[target])
+
+    hierarchy = {}
+    for story_id in story_ids:
+        feature = features.get(story_id)
+        epic = epics.get(feature["id"]) if feature else None
+        hierarchy[story_id] = StoryHierarchy(feature, epic, related[story_id])
+
+    return hierarchy
@@ -0,0 +1,160 @@
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from Scripts.instrumentation import metrics
+from Scripts.project_context import current_project
+from Scripts.rate_limiter import RATE_LIMIT_RETRIES, ado_limiter, gemini_limiter, request_priority, retry_delay
+
+# ================================
+# ENV & CONSTANTS
+# ================================
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# overridable so runs can target a local stand-in (see benchmarks/)
+AZURE_BASE_URL = os.getenv("AZURE_BASE_URL", "https://dev.azure.com")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "120"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+
+
+# ================================
+# SESSIONS
+# ================================
+def _build_session(auth=None, headers=None) -> requests.Session:
+    """
+    Keep-alive session with a sized connection pool. Only connection
+    failures and gateway errors on idempotent calls are retried here.
+    """
+    retry = Retry(
+        total=3,
+        connect=3,
+        read=0,
+        status=2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+        backoff_factor=0.5,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.auth = auth
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    session.headers.update(headers or {})
+    return session
+
+
+# one pool for every project; the PAT of the current project is sent per request
+ado_session = _build_session(headers={"Accept": "application/json"})
+gemini_session = _build_session(headers={"x-goog-api-key": GEMINI_API_KEY or ""})
+
+
+# ================================
+# URL HELPERS
+# ================================
+def project_url(path: str) -> str:
+    """https://dev.azure.com/{ORG}/{PROJECT}/_apis/{path} of the current project"""
+    project = current_project()
+    return f"{AZURE_BASE_URL}/{project.org}/{project.project}/_apis/{path}"
+
+
+def org_url(path: str) -> str:
+    """https://dev.azure.com/{ORG}/_apis/{path} of the current project"""
+    return f"{AZURE_BASE_URL}/{current_project().org}/_apis/{path}"
+
+
+def gemini_url(model: str, method: str = "generateContent") -> str:
+    return f"{GEMINI_BASE_URL}/models/{model}:{method}"
+
+
+# ================================
+# REQUESTS
+# ================================
+def request(session: requests.Session, method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Sends one call through the service's shared rate limiter. Throttled
+    (429) calls are retried after the delay the service asked for; the
+    limiter adapts its rate to every response.
+    """
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    limiter = gemini_limiter if session is gemini_session else ado_limiter
+    priority = request_priority(method, url)
+
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        limiter.acquire(priority)
+
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.record_http(method, url, "error", time.perf_counter() - started)
+            raise
+
+        # connection-level retries done by urllib3 for this call
+        retry_state = getattr(response.raw, "retries", None)
+        retries = len(retry_state.history) if retry_state is not None else 0
+        metrics.record_http(method, url, response.status_code, time.perf_counter() - started, retries)
+
+        delay = retry_delay(response)
+        limiter.observe(response.status_code, response.headers, delay)
+
+        if response.status_code != 429 or attempt == RATE_LIMIT_RETRIES:
+            return response
+        metrics.increment("http_throttled")
+        print(f"{method} {url} throttled, retrying in {delay or 0:.1f}s")
+        response.close()
+
+
+def _ado(method: str, url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("auth", current_project().auth)
+    return request(ado_session, method, url, **kwargs)
+
+
+def ado_get(url: str, **kwargs) -> requests.Response:
+    return _ado("GET", url, **kwargs)
+
+
+def ado_post(url: str, **kwargs) -> requests.Response:
+    return _ado("POST", url, **kwargs)
+
+
+def ado_get_paged(url: str, **kwargs) -> list:
+    """
+    GETs every page of a list endpoint, following the
+    x-ms-continuationtoken header, and returns the concatenated "value".
+    """
+    values = []
+    params = dict(kwargs.pop("params", None) or {})
+
+    while True:
+        res = ado_get(url, params=params, **kwargs)
+        if res.status_code != 200:
+            raise Exception(f"GET {url} failed: {res.status_code} {res.text}")
+
+        values.extend(res.json().get("value", []))
+
+        token = res.headers.get("x-ms-continuationtoken")
+        if not token:
+            return values
+        params["continuationToken"] = token
+
+
+def ado_patch(url: str, **kwargs) -> requests.Response:
+    return _ado("PATCH", url, **kwargs)
+
+
+def ado_delete(url: str, **kwargs) -> requests.Response:
+    return _ado("DELETE", url, **kwargs)
+
+
+def gemini_post(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", GEMINI_TIMEOUT)
+    return request(gemini_session, "POST", url, **kwargs)
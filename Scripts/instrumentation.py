@@ -0,0 +1,183 @@
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from Scripts.project_context import current_project
+
+RUN_SUMMARY_PATH = os.getenv("RUN_SUMMARY_PATH", "target/run_summary.json")
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf"))
+# latest samples per endpoint / stage that p50/p95/p99 are computed from
+LATENCY_SAMPLE_WINDOW = int(os.getenv("LATENCY_SAMPLE_WINDOW", "1000"))
+
+_ID_SEGMENT_RE = re.compile(r"/\d+(?=/|$)")
+_MODEL_RE = re.compile(r"/models/[^/:]+:")
+
+
+def endpoint_label(method, url):
+    """'POST /_apis/wit/workitems/{id}' style label without host, org/project and ids."""
+    path = urlparse(url).path
+    if "/_apis/" in path:
+        path = "/_apis/" + path.split("/_apis/", 1)[1]
+    path = _ID_SEGMENT_RE.sub("/{id}", path)
+    path = _MODEL_RE.sub("/models/{model}:", path)
+    return f"{method} {path}"
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class LatencyStats:
+    """
+    Count, mean, max and histogram of a latency series, with percentiles
+    over the latest LATENCY_SAMPLE_WINDOW samples, so memory stays bounded
+    however long the process runs.
+    """
+
+    def __init__(self, window=LATENCY_SAMPLE_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.samples.append(seconds)
+
+    def summary(self):
+        samples = sorted(self.samples)
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50": round(percentile(samples, 50), 4),
+            "p95": round(percentile(samples, 95), 4),
+            "p99": round(percentile(samples, 99), 4),
+            "max": round(self.max, 4),
+            "histogram": {("+inf" if b == float("inf") else f"<={b}"): n for b, n in zip(LATENCY_BUCKETS, self.buckets)},
+        }
+
+
+class Metrics:
+    """
+    Process-wide record of HTTP calls, retries, Gemini token usage and
+    pipeline stage timings, written to target/ at the end of a run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # per-story stage timings grow with the backlog; backfills and --serve turn them off
+        self.track_stories = True
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.http_latency = defaultdict(LatencyStats)
+            self.http_status = defaultdict(lambda: defaultdict(int))
+            self.retries = defaultdict(int)
+            self.gemini_tokens = defaultdict(int)
+            self.gemini_calls = 0
+            self.stage_latency = defaultdict(LatencyStats)
+            self.story_stages = defaultdict(dict)
+            self.counters = defaultdict(int)
+            self.project_http = defaultdict(int)
+            self.project_counters = defaultdict(lambda: defaultdict(int))
+            self.project_seconds = {}
+
+    def record_http(self, method, url, status, seconds, retries=0):
+        label = endpoint_label(method, url)
+        project = current_project().key
+        with self._lock:
+            self.http_latency[label].add(seconds)
+            self.http_status[label][str(status)] += 1
+            self.project_http[project] += 1
+            if retries:
+                self.retries[label] += retries
+
+    def record_gemini_usage(self, usage):
+        if not usage:
+            return
+        with self._lock:
+            self.gemini_calls += 1
+            for key in ("promptTokenCount", "candidatesTokenCount", "thoughtsTokenCount", "totalTokenCount"):
+                self.gemini_tokens[key] += usage.get(key, 0) or 0
+
+    def increment(self, name, amount=1):
+        project = current_project().key
+        with self._lock:
+            self.counters[name] += amount
+            self.project_counters[project][name] += amount
+
+    def record_project_run(self, project, seconds):
+        with self._lock:
+            self.project_seconds[project] = round(seconds, 3)
+
+    def _project_summary(self):
+        projects = {}
+        for project in sorted(set(self.project_http) | set(self.project_counters)):
+            counters = dict(self.project_counters.get(project, {}))
+            seconds = self.project_seconds.get(project)
+            projects[project] = {
+                "http_calls": self.project_http.get(project, 0),
+                "wall_seconds": seconds,
+                "stories_per_minute": round(counters.get("stories_processed", 0) * 60 / seconds, 2) if seconds else None,
+                "counters": counters,
+            }
+        return projects
+
+    @contextmanager
+    def stage(self, name, story_id=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.stage_latency[name].add(elapsed)
+                if story_id is not None and self.track_stories:
+                    stages = self.story_stages[str(story_id)]
+                    stages[name] = round(stages.get(name, 0.0) + elapsed, 4)
+
+    def summary(self, extra=None):
+        with self._lock:
+            http = {label: dict(stats.summary(), status=dict(self.http_status[label]),
+                                retries=self.retries.get(label, 0))
+                    for label, stats in sorted(self.http_latency.items())}
+            return {
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+                "wall_seconds": round(time.time() - self.started, 3),
+                "http_calls": sum(stats.count for stats in self.http_latency.values()),
+                "http_retries": sum(self.retries.values()),
+                "http": http,
+                "gemini": {"calls_with_usage": self.gemini_calls, "tokens": dict(self.gemini_tokens)},
+                "stages": {name: stats.summary() for name, stats in sorted(self.stage_latency.items())},
+                "stories": dict(self.story_stages),
+                "counters": dict(self.counters),
+                "projects": self._project_summary(),
+                **(extra or {}),
+            }
+
+    def write_summary(self, path=RUN_SUMMARY_PATH, extra=None):
+        summary = self.summary(extra)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+metrics = Metrics()
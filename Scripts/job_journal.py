@@ -0,0 +1,220 @@
+import json
+import os
+import threading
+import time
+
+from Scripts.test_case_schema import parse_test_cases
+
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", ".cache/journal")
+# completed journals untouched this long are deleted; their stories are then no
+# longer regenerated per scenario when the acceptance criteria change. 0 keeps all
+JOURNAL_RETENTION_DAYS = float(os.getenv("JOURNAL_RETENTION_DAYS", "90"))
+
+# stages in the order a story moves through them
+STAGES = ("suite_created", "generated", "test_cases_created", "linked_to_suite", "completed")
+
+
+class StoryJournal:
+    """
+    Per-story record of how far processing got: the suite, the generated
+    test cases and which of them already exist / are in the suite. Written
+    after every step so a crashed or re-run job resumes from the last
+    completed step instead of calling Gemini or creating work items again.
+
+    The cases are also tracked per acceptance criteria scenario hash, so a
+    later edit can regenerate only the scenarios that changed.
+    """
+
+    def __init__(self, story_id, path, data=None):
+        self.story_id = story_id
+        self.path = path
+        self.data = data or {"story_id": story_id, "stage": None, "created": {}, "linked": []}
+        self._lock = threading.Lock()
+        self._tests = None
+
+    @classmethod
+    def load(cls, story_id, directory=JOURNAL_DIR):
+        path = os.path.join(directory, f"{story_id}.json")
+        if not os.path.exists(path):
+            return cls(story_id, path)
+        with open(path, encoding="utf-8") as f:
+            return cls(story_id, path, json.load(f))
+
+    @property
+    def stage(self):
+        return self.data.get("stage")
+
+    @property
+    def suite(self):
+        """(plan_id, suite_id) recorded for the story, or None."""
+        if self.data.get("suite_id") is None:
+            return None
+        return self.data["plan_id"], self.data["suite_id"]
+
+    @property
+    def tests(self):
+        """The generated TestCase records, or None before generation."""
+        if self._tests is None and self.data.get("tests") is not None:
+            self._tests = parse_test_cases(self.data["tests"])
+        return self._tests
+
+    @property
+    def streamed(self):
+        """Cases recorded while a stream was published and never finished; [] otherwise."""
+        return parse_test_cases(self.data.get("streamed", []))
+
+    @property
+    def created(self):
+        """{1-based case index: work item id} of cases that already exist."""
+        return {int(idx): tc_id for idx, tc_id in self.data.get("created", {}).items()}
+
+    @property
+    def scenarios(self):
+        """[{"hash": scenario hash, "cases": [1-based case index, ...]}, ...] in criteria order, or None."""
+        return self.data.get("scenarios")
+
+    @property
+    def pending_updates(self):
+        """{1-based case index: work item id} of existing cases still to be rewritten with the new content."""
+        return {int(idx): tc_id for idx, tc_id in self.data.get("pending_updates", {}).items()}
+
+    @property
+    def pending_retire(self):
+        return list(self.data.get("pending_retire", []))
+
+    @property
+    def linked(self):
+        return list(self.data.get("linked", []))
+
+    @property
+    def unlinked(self):
+        linked = set(self.data.get("linked", []))
+        return [tc_id for tc_id in self.created.values() if tc_id not in linked]
+
+    def is_resumable(self):
+        return self.stage is not None and self.stage != "completed"
+
+    def _advance(self, stage):
+        current = self.stage
+        if current is None or STAGES.index(stage) >= STAGES.index(current):
+            self.data["stage"] = stage
+
+    def record_suite(self, plan_id, suite_id):
+        with self._lock:
+            self.data["plan_id"] = plan_id
+            self.data["suite_id"] = suite_id
+            self._advance("suite_created")
+            self._save()
+
+    def record_generated(self, tests, scenario_hashes=None):
+        """scenario_hashes: hash of each criteria scenario, in the order the prompt numbered them."""
+        with self._lock:
+            self._tests = list(tests)
+            self.data["tests"] = [tc.to_json() for tc in self._tests]
+            self.data.pop("streamed", None)
+            if scenario_hashes is not None:
+                scenarios = [{"hash": h, "cases": []} for h in scenario_hashes]
+                for idx, tc in enumerate(self._tests, start=1):
+                    if 1 <= tc.scenario <= len(scenarios):
+                        scenarios[tc.scenario - 1]["cases"].append(idx)
+                self.data["scenarios"] = scenarios
+            self._advance("generated")
+            self._save()
+
+    def record_streamed(self, numbered_cases):
+        """
+        numbered_cases: [(index, case), ...] of a streamed group, recorded
+        before it is published so created indexes survive a crash mid-stream.
+        """
+        with self._lock:
+            streamed = self.data.setdefault("streamed", [])
+            for idx, tc in numbered_cases:
+                if idx > len(streamed):
+                    streamed.append(tc.to_json())
+            self._save()
+
+    def record_regenerated(self, tests, scenarios, created, updates, retire):
+        """
+        Replaces the generated cases after some scenarios changed and starts
+        the story over from "generated". created maps the new indexes of kept
+        cases to their work items, updates the indexes whose existing work
+        item still needs the new content, and retire the ids to close.
+        """
+        with self._lock:
+            self._tests = list(tests)
+            self.data["tests"] = [tc.to_json() for tc in self._tests]
+            self.data["scenarios"] = scenarios
+            self.data["created"] = {str(idx): tc_id for idx, tc_id in created.items()}
+            self.data["pending_updates"] = {str(idx): tc_id for idx, tc_id in updates.items()}
+            self.data["pending_retire"] = list(retire)
+            self.data["stage"] = "generated"
+            self._save()
+
+    def record_updated(self, updated):
+        """updated: [(index, work_item_id), ...] rewritten with their new content."""
+        with self._lock:
+            pending = self.data.get("pending_updates", {})
+            for idx, tc_id in updated:
+                pending.pop(str(idx), None)
+                self.data["created"][str(idx)] = tc_id
+            self._save()
+
+    def record_retired(self, ids):
+        with self._lock:
+            retired = self.data.setdefault("retired", [])
+            retired.extend(tc_id for tc_id in ids if tc_id not in retired)
+            self.data["pending_retire"] = [i for i in self.data.get("pending_retire", []) if i not in ids]
+            self.data["linked"] = [i for i in self.data["linked"] if i not in ids]
+            self._save()
+
+    def record_created(self, created):
+        """created: [(index, work_item_id), ...] from one creation call."""
+        with self._lock:
+            for idx, tc_id in created:
+                self.data["created"][str(idx)] = tc_id
+            self._advance("test_cases_created")
+            self._save()
+
+    def record_linked(self, ids):
+        with self._lock:
+            linked = self.data["linked"]
+            linked.extend(tc_id for tc_id in ids if tc_id not in linked)
+            self._advance("linked_to_suite")
+            self._save()
+
+    def complete(self):
+        with self._lock:
+            self._advance("completed")
+            self._save()
+
+    def _save(self):
+        self.data["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def prune_journals(directory=JOURNAL_DIR, retention_days=JOURNAL_RETENTION_DAYS):
+    """
+    Deletes completed journals last written more than retention_days ago;
+    unfinished ones are kept until their story is done. Returns the count.
+    """
+    if retention_days <= 0 or not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - retention_days * 86400
+    pruned = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.endswith(".json") or os.path.getmtime(path) >= cutoff:
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                completed = json.load(f).get("stage") == "completed"
+        except (OSError, ValueError):
+            continue
+        if completed:
+            os.remove(path)
+            pruned += 1
+    return pruned
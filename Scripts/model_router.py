@@ -0,0 +1,165 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple
+
+from Scripts.instrumentation import LatencyStats, metrics, percentile
+
+# stronger model for large acceptance criteria (and the fallback when tiering is off)
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# cheaper, faster model for small acceptance criteria; empty disables tiering
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+# criteria estimated at up to this many tokens go to the fast tier
+GEMINI_FAST_MAX_TOKENS = int(os.getenv("GEMINI_FAST_MAX_TOKENS", "300"))
+
+# send one duplicate request once a call runs longer than this percentile of its tier; 0 disables hedging
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+# latencies a tier needs before its percentile is trusted; until then GEMINI_HEDGE_INITIAL_DELAY applies
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+GEMINI_HEDGE_INITIAL_DELAY = float(os.getenv("GEMINI_HEDGE_INITIAL_DELAY", "30"))
+# never hedge sooner than this, however fast the tier usually is
+GEMINI_HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "1"))
+
+# recent request latencies per tier the hedge delay is computed from
+LATENCY_WINDOW = 200
+
+
+class ModelTier(NamedTuple):
+    name: str
+    model: str
+
+
+STRONG = ModelTier("strong", GEMINI_MODEL)
+FAST = ModelTier("fast", GEMINI_FAST_MODEL or GEMINI_MODEL)
+
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting
+    return len(text) // 4 + 1
+
+
+def route(cleaned):
+    """Tier for a story's preprocessed acceptance criteria."""
+    if GEMINI_FAST_MODEL and estimate_tokens(cleaned) <= GEMINI_FAST_MAX_TOKENS:
+        return FAST
+    return STRONG
+
+
+class _TierStats:
+    def __init__(self, model):
+        self.model = model
+        self.window = deque(maxlen=LATENCY_WINDOW)
+        self.latencies = LatencyStats()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failed = 0
+
+
+class ModelRouter:
+    """
+    Runs Gemini calls for a tier, hedging slow ones: when a call has not
+    returned after the tier's GEMINI_HEDGE_PERCENTILE latency, the same
+    request is sent once more and whichever answers first is used. The
+    slower request is left to finish in the background and ignored.
+    """
+
+    def __init__(self, hedge_percentile=GEMINI_HEDGE_PERCENTILE, workers=16):
+        self.hedge_percentile = hedge_percentile
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gemini-hedge")
+        self._lock = threading.Lock()
+        self._tiers = {}
+
+    def _stats(self, tier):
+        stats = self._tiers.get(tier.name)
+        if stats is None:
+            stats = self._tiers[tier.name] = _TierStats(tier.model)
+        return stats
+
+    def hedge_delay(self, tier):
+        with self._lock:
+            window = sorted(self._stats(tier).window)
+        if len(window) < GEMINI_HEDGE_MIN_SAMPLES:
+            return GEMINI_HEDGE_INITIAL_DELAY
+        return max(GEMINI_HEDGE_MIN_DELAY, percentile(window, self.hedge_percentile))
+
+    def _submit(self, tier, call):
+        context = contextvars.copy_context()
+        started = time.perf_counter()
+
+        def timed():
+            try:
+                return context.run(call)
+            finally:
+                with self._lock:
+                    self._stats(tier).window.append(time.perf_counter() - started)
+
+        return self._executor.submit(timed)
+
+    def call(self, tier, call):
+        """Returns call()'s result, sending a hedged duplicate if it is slow."""
+        started = time.perf_counter()
+        primary = self._submit(tier, call)
+        pending = {primary}
+        hedge = None
+        errors = []
+
+        if self.hedge_percentile > 0:
+            done, pending = wait(pending, timeout=self.hedge_delay(tier))
+            if not done:
+                print(f"Gemini {tier.model} slower than p{self.hedge_percentile:g}, sending a hedged request")
+                hedge = self._submit(tier, call)
+                pending.add(hedge)
+            else:
+                pending = done
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                    continue
+                self._record(tier, time.perf_counter() - started, hedge, won_by_hedge=future is hedge)
+                return future.result()
+
+        self._record(tier, time.perf_counter() - started, hedge, failed=True)
+        raise errors[0]
+
+    def record(self, tier, seconds, failed=False):
+        """Counts a call made outside call(), e.g. a streamed one, which cannot be hedged."""
+        with self._lock:
+            self._stats(tier).window.append(seconds)
+        self._record(tier, seconds, None, failed=failed)
+
+    def _record(self, tier, seconds, hedge, won_by_hedge=False, failed=False):
+        with self._lock:
+            stats = self._stats(tier)
+            stats.calls += 1
+            stats.latencies.add(seconds)
+            stats.hedged += hedge is not None
+            stats.hedge_wins += won_by_hedge
+            stats.failed += failed
+        metrics.increment(f"gemini_calls_{tier.name}")
+        if won_by_hedge:
+            metrics.increment("gemini_hedge_wins")
+
+    def stats(self):
+        """Per-tier model, call counts and p50/p95/p99 of the latency callers saw."""
+        with self._lock:
+            return {
+                name: {
+                    "model": stats.model,
+                    "calls": stats.calls,
+                    "hedged": stats.hedged,
+                    "hedge_wins": stats.hedge_wins,
+                    "failed": stats.failed,
+                    "latency": {k: v for k, v in stats.latencies.summary().items() if k != "histogram"},
+                }
+                for name, stats in sorted(self._tiers.items())
+            }
+
+
+model_router = ModelRouter()
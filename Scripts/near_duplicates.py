@@ -0,0 +1,173 @@
+import os
+import random
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# estimated Jaccard similarity at or above which two test cases count as the same case
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+# word shingle length; cases differing in a word or two (valid vs invalid) differ in several shingles
+SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "2"))
+# a step found in this many cases is shared setup (opening the page, logging in)
+# and left out of the comparison, so it cannot make unrelated cases look alike
+DEDUP_SHARED_STEP_CASES = int(os.getenv("DEDUP_SHARED_STEP_CASES", "3"))
+MINHASH_PERMUTATIONS = 64
+# LSH banding: 16 bands x 4 rows finds pairs with Jaccard >= ~0.5 with high probability
+LSH_BANDS = 16
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(MINHASH_PERMUTATIONS)]
+
+
+def normalize_text(text: str) -> str:
+    return _NON_WORD_RE.sub(" ", text.lower()).strip()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    words = normalize_text(text).split()
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+
+def minhash(shingle_set: set) -> Tuple[int, ...]:
+    return tuple(
+        min((a * s + b) % _MERSENNE_PRIME for s in shingle_set)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def similarity(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures with LSH buckets, so a new text is only compared
+    with the few earlier texts that share a band with it.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, bands: int = LSH_BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = MINHASH_PERMUTATIONS // bands
+        self._signatures: Dict[object, Tuple[int, ...]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[object]] = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _bands(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def find(self, text: str) -> Optional[Tuple[object, float]]:
+        """(key, similarity) of the closest indexed near-duplicate, or None."""
+        return self._find(minhash(shingles(text)))
+
+    def _find(self, signature):
+        best = None
+        checked = set()
+        for bucket in self._bands(signature):
+            for key in self._buckets.get(bucket, ()):
+                if key in checked:
+                    continue
+                checked.add(key)
+                score = similarity(signature, self._signatures[key])
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (key, score)
+        return best
+
+    def add(self, key, text: str):
+        self._add(key, minhash(shingles(text)))
+
+    def _add(self, key, signature):
+        self._signatures[key] = signature
+        for bucket in self._bands(signature):
+            self._buckets.setdefault(bucket, []).append(key)
+
+    def add_if_new(self, key, text: str) -> Optional[Tuple[object, float]]:
+        """Indexes text unless it near-duplicates an indexed one, which is returned instead."""
+        signature = minhash(shingles(text))
+        match = self._find(signature)
+        if match is None:
+            self._add(key, signature)
+        return match
+
+
+Steps = Sequence[Tuple[str, str]]
+
+
+class CaseDuplicateIndex:
+    """
+    Near-duplicate detection for test cases. A case is only compared with
+    cases of the same type (and with untyped ones, e.g. written by hand), on
+    its title, actions and expected results, leaving out the steps at least
+    DEDUP_SHARED_STEP_CASES cases share.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, shared_step_cases: int = DEDUP_SHARED_STEP_CASES):
+        self.threshold = threshold
+        self.shared_step_cases = shared_step_cases
+        self._cases: Dict[object, Tuple[Optional[str], str, Steps]] = {}
+        self._step_cases: Counter = Counter()
+        self._shared: set = set()
+        self._indexes: Dict[Optional[str], NearDuplicateIndex] = {}
+
+    def __len__(self):
+        return len(self._cases)
+
+    def _text(self, title: str, steps: Steps) -> str:
+        parts = [title]
+        for action, expected in steps:
+            if _step_key(action, expected) not in self._shared:
+                parts += [action, expected]
+        return " ".join(parts)
+
+    def find(self, case_type: Optional[str], title: str, steps: Steps) -> Optional[Tuple[object, float]]:
+        """(key, similarity) of the closest indexed case of the same type, or None."""
+        types = [case_type, None] if case_type is not None else list(self._indexes)
+        text = self._text(title, steps)
+        best = None
+        for group in types:
+            if group not in self._indexes:
+                continue
+            match = self._indexes[group].find(text)
+            if match is not None and (best is None or match[1] > best[1]):
+                best = match
+        return best
+
+    def add(self, key, case_type: Optional[str], title: str, steps: Steps):
+        self._cases[key] = (case_type, title, steps)
+        self._step_cases.update({_step_key(action, expected) for action, expected in steps})
+        shared = {step for step, cases in self._step_cases.items() if cases >= self.shared_step_cases}
+        if shared != self._shared:
+            # the texts already indexed still hold the newly shared steps
+            self._shared = shared
+            self._indexes = {}
+            for indexed_key, (indexed_type, indexed_title, indexed_steps) in self._cases.items():
+                self._index(indexed_type).add(indexed_key, self._text(indexed_title, indexed_steps))
+        else:
+            self._index(case_type).add(key, self._text(title, steps))
+
+    def add_if_new(self, key, case_type: Optional[str], title: str, steps: Steps) -> Optional[Tuple[object, float]]:
+        """Indexes the case unless it near-duplicates an indexed one, which is returned instead."""
+        match = self.find(case_type, title, steps)
+        if match is None:
+            self.add(key, case_type, title, steps)
+        return match
+
+    def _index(self, case_type):
+        if case_type not in self._indexes:
+            self._indexes[case_type] = NearDuplicateIndex(self.threshold)
+        return self._indexes[case_type]
+
+
+def _step_key(action: str, expected: str) -> Tuple[str, str]:
+    return normalize_text(action), normalize_text(expected)
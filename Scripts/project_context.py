@@ -0,0 +1,108 @@
+import contextvars
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple
+
+# ================================
+# ENV & CONSTANTS
+# ================================
+ORG = os.getenv("AZURE_ORG")
+PROJECT = os.getenv("AZURE_PROJECT")
+PAT = os.getenv("AZURE_PAT")
+
+
+class AzureProject(NamedTuple):
+    org: str
+    project: str
+    pat: str
+
+    @property
+    def auth(self):
+        return ("", self.pat or "")
+
+    @property
+    def key(self):
+        return f"{self.org}/{self.project}"
+
+
+# the project configured through AZURE_ORG / AZURE_PROJECT / AZURE_PAT
+DEFAULT_PROJECT = AzureProject(ORG, PROJECT, PAT)
+
+_current = contextvars.ContextVar("azure_project", default=DEFAULT_PROJECT)
+
+
+def current_project() -> AzureProject:
+    """The project the calling thread / task is working on."""
+    return _current.get()
+
+
+@contextmanager
+def use_project(project: AzureProject):
+    token = _current.set(project)
+    try:
+        yield project
+    finally:
+        _current.reset(token)
+
+
+def parse_projects(specs):
+    """
+    AzureProject per "org/project" (or bare "project", using AZURE_ORG) spec.
+    PATs are organisation scoped: AZURE_PAT_<ORG> wins over AZURE_PAT.
+    """
+    projects = []
+    for spec in specs:
+        org, _, project = spec.strip().rpartition("/")
+        org = org or ORG
+        pat = os.getenv("AZURE_PAT_" + re.sub(r"\W", "_", org or "").upper(), PAT)
+        projects.append(AzureProject(org, project, pat))
+    return projects
+
+
+def scoped_path(path: str) -> str:
+    """
+    Per-project location of an on-disk state file or directory: unchanged
+    for the default project, under <dir>/<org>/<project>/ for any other.
+    """
+    project = current_project()
+    if project == DEFAULT_PROJECT:
+        return path
+    directory, name = os.path.split(path)
+    return os.path.join(directory, _safe(project.org), _safe(project.project), name)
+
+
+def _safe(part):
+    return re.sub(r"[^\w.-]", "_", part or "_")
+
+
+class ProjectScoped:
+    """
+    Lazily created instance of factory() per project, picked by the current
+    project context. Attribute access is forwarded to that instance, so a
+    module-level ProjectScoped works like the single global it replaces.
+    """
+
+    def __init__(self, factory):
+        # prefixed so they never shadow attributes of the wrapped instances
+        object.__setattr__(self, "_scoped_factory", factory)
+        object.__setattr__(self, "_scoped_instances", {})
+        object.__setattr__(self, "_scoped_lock", threading.Lock())
+
+    def current(self):
+        key = current_project().key
+        with self._scoped_lock:
+            instance = self._scoped_instances.get(key)
+            if instance is None:
+                instance = self._scoped_instances[key] = self._scoped_factory()
+            return instance
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.current(), name, value)
+
+    def __len__(self):
+        return len(self.current())
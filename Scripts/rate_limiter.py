@@ -0,0 +1,162 @@
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# request priorities; lower is served first
+WRITE = 0
+READ = 1
+
+ADO_RATE = float(os.getenv("ADO_RATE", "20"))
+ADO_MAX_RATE = float(os.getenv("ADO_MAX_RATE", "200"))
+GEMINI_RATE = float(os.getenv("GEMINI_RATE", "5"))
+GEMINI_MAX_RATE = float(os.getenv("GEMINI_MAX_RATE", "50"))
+# times a throttled (429) call is retried after waiting as told
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "5"))
+
+# slow down once less than this share of the X-RateLimit-Limit budget remains
+LOW_REMAINING_RATIO = 0.1
+_GEMINI_RETRY_DELAY_RE = re.compile(r"^([\d.]+)s$")
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by every thread calling one service. The rate grows
+    additively while responses come back clean and is halved on throttling
+    (AIMD), so it settles just below what the service allows. A Retry-After
+    or quota delay pauses the whole bucket. Waiting callers are served by
+    priority, then arrival, so writes are not starved by bulk reads.
+    """
+
+    def __init__(self, name, rate, max_rate, min_rate=0.5):
+        self.name = name
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.tokens = max(1.0, rate)
+        self.paused_until = 0.0
+        self.throttled = 0
+        self.waited = 0.0
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority=READ):
+        entry = (priority, next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] == entry:
+                        if now >= self.paused_until and self.tokens >= 1:
+                            self.tokens -= 1
+                            break
+                        timeout = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.001)
+                    else:
+                        timeout = None
+                    self._cond.wait(timeout)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            self.waited += waited
+        return waited
+
+    def observe(self, status, headers, retry_after=None):
+        """Adapts the rate to one response."""
+        with self._cond:
+            now = time.monotonic()
+            if status == 429 or retry_after:
+                self.throttled += 1
+                # calls already in flight when the pause began are throttled too; halve once per pause
+                if now >= self.paused_until:
+                    self.rate = max(self.min_rate, self.rate / 2)
+                self.tokens = 0.0
+                self.paused_until = max(self.paused_until, now + (retry_after or 1 / self.rate))
+            elif _under_pressure(headers):
+                self.rate = max(self.min_rate, self.rate * 0.8)
+            elif 200 <= status < 300:
+                self.rate = min(self.max_rate, self.rate + 1 / max(self.rate, 1))
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "rate": round(self.rate, 2),
+                "throttled": self.throttled,
+                "waited_seconds": round(self.waited, 3),
+            }
+
+
+def _under_pressure(headers):
+    """Azure DevOps adds X-RateLimit-* headers once a caller uses up its budget."""
+    if float(headers.get("X-RateLimit-Delay") or 0) > 0:
+        return True
+    limit = headers.get("X-RateLimit-Limit")
+    remaining = headers.get("X-RateLimit-Remaining")
+    try:
+        return limit is not None and remaining is not None and float(remaining) < float(limit) * LOW_REMAINING_RATIO
+    except ValueError:
+        return False
+
+
+def retry_delay(response):
+    """
+    Seconds the service asked us to wait: Retry-After (seconds or HTTP
+    date), a drained X-RateLimit-Reset, or the RetryInfo of a Gemini quota
+    error. None when the response carries no such hint.
+    """
+    headers = response.headers
+    value = headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    if headers.get("X-RateLimit-Remaining") == "0" and headers.get("X-RateLimit-Reset"):
+        try:
+            return max(0.0, float(headers["X-RateLimit-Reset"]) - time.time())
+        except ValueError:
+            pass
+
+    if response.status_code == 429:
+        try:
+            details = response.json().get("error", {}).get("details", [])
+        except (ValueError, AttributeError):
+            details = []
+        for detail in details:
+            match = _GEMINI_RETRY_DELAY_RE.match(str(detail.get("retryDelay", "")))
+            if match:
+                return float(match.group(1))
+    return None
+
+
+def request_priority(method, url):
+    """Reads (GET, WIQL, workitemsbatch) queue behind writes."""
+    if method == "GET" or "/wiql" in url or "/workitemsbatch" in url:
+        return READ
+    return WRITE
+
+
+ado_limiter = AdaptiveRateLimiter("azure_devops", ADO_RATE, ADO_MAX_RATE)
+gemini_limiter = AdaptiveRateLimiter("gemini", GEMINI_RATE, GEMINI_MAX_RATE)
+
+
+def limiter_stats():
+    return {limiter.name: limiter.stats() for limiter in (ado_limiter, gemini_limiter)}
@@ -0,0 +1,216 @@
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from Scripts.azure_client import get_work_items_batch, iter_work_item_id_pages
+from Scripts.project_context import ProjectScoped, scoped_path
+from Scripts.testcase_creator import parse_test_steps_xml
+from Scripts.work_item_cache import work_item_cache
+
+REGRESSION_INDEX_PATH = os.getenv("REGRESSION_INDEX_PATH", ".cache/regression_index.npz")
+# similar existing test cases added to a story's Regression suite; 0 disables the index
+REGRESSION_TOP_K = int(os.getenv("REGRESSION_TOP_K", "5"))
+# cosine similarity below which a candidate is not considered related
+REGRESSION_MIN_SCORE = float(os.getenv("REGRESSION_MIN_SCORE", "0.25"))
+# the service hook receiver re-syncs the index at most this often
+REGRESSION_INDEX_REFRESH_SECONDS = float(os.getenv("REGRESSION_INDEX_REFRESH_SECONDS", "300"))
+
+INDEX_FIELDS = ["System.Title", "Microsoft.VSTS.TCM.Steps", "System.State", "System.ChangedDate"]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]{2,}")
+_STOP_WORDS = {
+    "the", "and", "for", "with", "that", "this", "then", "when", "given", "are", "is", "be", "to", "of",
+    "in", "on", "an", "as", "it", "by", "or", "at", "from", "should", "user", "test", "case", "verify",
+}
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in _STOP_WORDS]
+
+
+def test_case_document(fields):
+    """Indexed text of a Test Case: title plus every step action and expected result."""
+    pairs = parse_test_steps_xml(fields.get("Microsoft.VSTS.TCM.Steps", ""))
+    return " ".join([fields.get("System.Title", "")] + [part for pair in pairs for part in pair])
+
+
+class RegressionIndex:
+    """
+    TF-IDF index of the project's existing Test Cases.
+
+    Documents are kept as (term ids, term counts) arrays so single cases can
+    be added or replaced; the inverted postings, IDF weights and document
+    norms are rebuilt with vectorised NumPy on the first query after a
+    change. Queries touch only the postings of the query's terms.
+    """
+
+    def __init__(self, path=REGRESSION_INDEX_PATH):
+        self.path = path
+        self.watermark = None
+        self.synced_at = 0.0
+        self.vocab = {}
+        self._docs = {}
+        self._lock = threading.RLock()
+        self._built = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    # ----------------------------------------------------------- updates
+    def upsert(self, test_case_id, text):
+        counts = {}
+        with self._lock:
+            for token in tokenize(text):
+                term = self.vocab.setdefault(token, len(self.vocab))
+                counts[term] = counts.get(term, 0) + 1
+            if not counts:
+                self._docs.pop(test_case_id, None)
+            else:
+                self._docs[test_case_id] = (np.fromiter(counts.keys(), np.int32, len(counts)),
+                                            np.fromiter(counts.values(), np.float32, len(counts)))
+            self._built = None
+
+    def remove(self, test_case_id):
+        with self._lock:
+            if self._docs.pop(test_case_id, None) is not None:
+                self._built = None
+
+    def _build(self):
+        ids = np.fromiter(self._docs.keys(), np.int64, len(self._docs))
+        lengths = np.fromiter((len(terms) for terms, _ in self._docs.values()), np.int64, len(self._docs))
+        terms = np.concatenate([t for t, _ in self._docs.values()])
+        counts = np.concatenate([c for _, c in self._docs.values()])
+        rows = np.repeat(np.arange(len(ids)), lengths)
+
+        vocab_size = len(self.vocab)
+        df = np.bincount(terms, minlength=vocab_size)
+        idf = (np.log((1 + len(ids)) / (1 + df)) + 1).astype(np.float32)
+        weights = (1 + np.log(counts)) * idf[terms]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(ids))).astype(np.float32)
+
+        # postings: for each term the rows containing it, contiguous in term order
+        order = np.argsort(terms, kind="stable")
+        postings_ptr = np.zeros(vocab_size + 1, np.int64)
+        np.cumsum(df, out=postings_ptr[1:])
+        return ids, idf, norms, postings_ptr, rows[order], weights[order]
+
+    # ----------------------------------------------------------- queries
+    def top_k(self, text, k=REGRESSION_TOP_K, min_score=REGRESSION_MIN_SCORE, exclude=()):
+        """[(test_case_id, cosine similarity), ...] best first."""
+        with self._lock:
+            if not self._docs or k <= 0:
+                return []
+            if self._built is None:
+                self._built = self._build()
+            ids, idf, norms, postings_ptr, post_rows, post_weights = self._built
+
+        counts = {}
+        for token in tokenize(text):
+            term = self.vocab.get(token)
+            if term is not None:
+                counts[term] = counts.get(term, 0) + 1
+        if not counts:
+            return []
+
+        scores = np.zeros(len(ids), np.float32)
+        query_norm = 0.0
+        for term, count in counts.items():
+            if term >= len(idf):
+                continue
+            weight = (1 + math.log(count)) * float(idf[term])
+            query_norm += weight * weight
+            start, end = postings_ptr[term], postings_ptr[term + 1]
+            scores[post_rows[start:end]] += weight * post_weights[start:end]
+        if not query_norm:
+            return []
+        scores /= np.maximum(norms, 1e-9) * math.sqrt(query_norm)
+
+        if exclude:
+            scores[np.isin(ids, np.fromiter(exclude, np.int64))] = 0
+        candidates = min(len(ids), k)
+        best = np.argpartition(-scores, candidates - 1)[:candidates]
+        best = best[np.argsort(-scores[best])]
+        return [(int(ids[i]), round(float(scores[i]), 4)) for i in best if scores[i] >= min_score]
+
+    # ----------------------------------------------------------- persistence
+    @classmethod
+    def load(cls, path=REGRESSION_INDEX_PATH):
+        index = cls(path)
+        if not os.path.exists(path):
+            return index
+        with np.load(path, allow_pickle=False) as data:
+            index.vocab = {token: i for i, token in enumerate(data["vocab"].tolist())}
+            index.watermark = str(data["watermark"]) or None
+            # every data[...] access decompresses the array again; read each once
+            bounds, terms, counts = data["doc_ptr"], data["doc_terms"], data["doc_counts"]
+            for i, test_case_id in enumerate(data["ids"].tolist()):
+                start, end = bounds[i], bounds[i + 1]
+                index._docs[test_case_id] = (terms[start:end], counts[start:end])
+        return index
+
+    def save(self):
+        with self._lock:
+            docs = list(self._docs.items())
+            vocab = sorted(self.vocab, key=self.vocab.get)
+        lengths = [len(terms) for _, (terms, _) in docs]
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            ids=np.array([i for i, _ in docs], np.int64),
+            doc_ptr=np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]),
+            doc_terms=np.concatenate([t for _, (t, _) in docs]) if docs else np.zeros(0, np.int32),
+            doc_counts=np.concatenate([c for _, (_, c) in docs]) if docs else np.zeros(0, np.float32),
+            vocab=np.array(vocab, dtype=str),
+            watermark=np.array(self.watermark or ""),
+        )
+        os.replace(tmp_path, self.path)
+
+    def stats(self):
+        return {"test_cases": len(self._docs), "terms": len(self.vocab), "watermark": self.watermark}
+
+
+def sync_regression_index(index, min_interval=0):
+    """
+    Pulls Test Cases changed since the index watermark (all of them on the
+    first sync) and updates their entries; Closed cases are dropped.
+    Returns the number of changed cases, or None when synced too recently.
+    """
+    with index._lock:
+        if min_interval and time.monotonic() - index.synced_at < min_interval:
+            return None
+        index.synced_at = time.monotonic()
+        since = index.watermark
+
+    condition = "[System.WorkItemType] = 'Test Case'"
+    if since:
+        condition += f" AND [System.ChangedDate] >= '{since}'"
+
+    # the next sync starts at the moment the first page was queried; edits
+    # made while the pages are read are picked up again then
+    watermark = None
+    changed = 0
+    for ids, as_of in iter_work_item_id_pages(condition, time_precision=True):
+        watermark = watermark or as_of
+        # a copy cached earlier (e.g. as a Related target) may predate the edit
+        for work_id in ids:
+            work_item_cache.invalidate(work_id)
+        for item in get_work_items_batch(ids, fields=INDEX_FIELDS):
+            fields = item.get("fields", {})
+            if fields.get("System.State") == "Closed":
+                index.remove(item["id"])
+            else:
+                index.upsert(item["id"], test_case_document(fields))
+        changed += len(ids)
+
+    index.watermark = watermark or since
+    if changed:
+        index.save()
+    return changed
+
+
+regression_index = ProjectScoped(lambda: RegressionIndex.load(scoped_path(REGRESSION_INDEX_PATH)))
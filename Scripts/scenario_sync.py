@@ -0,0 +1,104 @@
+from collections import defaultdict, deque
+from typing import List, Optional, Tuple
+
+from Scripts.ac_preprocessor import preprocess_acceptance, scenario_hash, split_scenarios
+from Scripts.gemini_client import generate_scenario_test_cases
+from Scripts.instrumentation import metrics
+
+
+def story_scenarios(story) -> List[str]:
+    """The story's acceptance criteria scenarios, as numbered in the prompt."""
+    return split_scenarios(preprocess_acceptance(story["acceptance"]).text)
+
+
+def scenario_hashes(story) -> List[str]:
+    return [scenario_hash(scenario) for scenario in story_scenarios(story)]
+
+
+def diff_scenarios(old: List[str], new: List[str]) -> List[Tuple[Optional[int], Optional[int]]]:
+    """
+    Aligns two scenario hash lists into (old index, new index) pairs: one per
+    new scenario in new order, then the removed ones. A hash still present
+    anywhere keeps its old scenario, so a moved scenario is not regenerated.
+    The remaining old and new scenarios are then paired in order as edits.
+    An old index of None marks an added scenario, a new index of None a
+    removed one.
+    """
+    unmatched = defaultdict(deque)
+    for i, h in enumerate(old):
+        unmatched[h].append(i)
+
+    matched = [unmatched[h].popleft() if unmatched[h] else None for h in new]
+    left = deque(sorted(i for indexes in unmatched.values() for i in indexes))
+
+    pairs = []
+    for j, i in enumerate(matched):
+        if i is None and left:
+            i = left.popleft()
+        pairs.append((i, j))
+    pairs.extend((i, None) for i in left)
+    return pairs
+
+
+def regenerate_changed_scenarios(story, journal) -> bool:
+    """
+    Regenerates the cases of the scenarios added or edited since the
+    journal's cases were generated, one parallel prompt per scenario, and
+    records the new case list in the journal. The existing Test Cases of an
+    edited scenario are marked for rewriting with the new cases and any left
+    over, or belonging to a removed scenario, for retirement. Returns False
+    when nothing changed or the journal has no per-scenario record.
+    """
+    if journal.scenarios is None or journal.tests is None:
+        print(f"story {story['id']} has no per-scenario record, not regenerating")
+        return False
+
+    scenarios = story_scenarios(story)
+    new_hashes = [scenario_hash(scenario) for scenario in scenarios]
+    old = journal.scenarios
+    old_hashes = [entry["hash"] for entry in old]
+    if new_hashes == old_hashes:
+        return False
+
+    pairs = diff_scenarios(old_hashes, new_hashes)
+    changed = [j for i, j in pairs if j is not None and (i is None or old_hashes[i] != new_hashes[j])]
+    generated = generate_scenario_test_cases([scenarios[j] for j in changed])
+
+    old_tests = journal.tests
+    old_created = journal.created
+    tests, created, updates, retire, entries = [], {}, {}, [], []
+
+    def add(tc, scenario, existing_id=None):
+        tests.append(tc._replace(scenario=scenario))
+        if existing_id is not None:
+            created[len(tests)] = existing_id
+        return len(tests)
+
+    # cases Gemini did not attribute to a scenario are left alone
+    attributed = {idx for entry in old for idx in entry["cases"]}
+    for idx, tc in enumerate(old_tests, start=1):
+        if idx not in attributed and idx in old_created:
+            add(tc, 0, old_created[idx])
+
+    for i, j in pairs:
+        old_cases = [idx for idx in old[i]["cases"] if idx in old_created] if i is not None else []
+        if j is None:
+            retire.extend(old_created[idx] for idx in old_cases)
+            continue
+
+        if i is not None and old_hashes[i] == new_hashes[j]:
+            cases = [add(old_tests[idx - 1], j + 1, old_created[idx]) for idx in old_cases]
+        else:
+            fresh = generated[scenarios[j]]
+            cases = [add(tc, j + 1) for tc in fresh]
+            for idx, old_idx in zip(cases, old_cases):
+                updates[idx] = old_created[old_idx]
+            retire.extend(old_created[idx] for idx in old_cases[len(fresh):])
+        entries.append({"hash": new_hashes[j], "cases": cases})
+
+    removed = sum(1 for _, j in pairs if j is None)
+    print(f"story {story['id']}: {len(changed)} of {len(scenarios)} scenarios added or changed, {removed} removed; "
+          f"{len(updates)} test cases to update, {len(retire)} to retire")
+    metrics.increment("scenarios_regenerated", len(changed))
+    journal.record_regenerated(tests, entries, created, updates, retire)
+    return True
@@ -0,0 +1,229 @@
+import base64
+import hmac
+import ipaddress
+import json
+import os
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# loopback unless told otherwise; any other address also needs SERVICE_HOOK_SECRET
+SERVICE_HOOK_HOST = os.getenv("SERVICE_HOOK_HOST", "127.0.0.1")
+SERVICE_HOOK_PORT = int(os.getenv("SERVICE_HOOK_PORT", "8080"))
+SERVICE_HOOK_WORKERS = int(os.getenv("SERVICE_HOOK_WORKERS", "4"))
+# password of the hook's basic authentication (Azure DevOps service hook "Password")
+SERVICE_HOOK_SECRET = os.getenv("SERVICE_HOOK_SECRET")
+
+HANDLED_EVENTS = {"workitem.created", "workitem.updated"}
+MAX_PAYLOAD_BYTES = 5 * 1024 * 1024
+
+
+def story_id_from_event(event):
+    """
+    The User Story id a workitem.created / workitem.updated payload is about,
+    or None for other events and work item types.
+    """
+    if event.get("eventType") not in HANDLED_EVENTS:
+        return None
+
+    resource = event.get("resource") or {}
+    if event["eventType"] == "workitem.updated":
+        # updated events carry the change set; the new state is under "revision"
+        fields = (resource.get("revision") or {}).get("fields", {})
+        work_item_id = resource.get("workItemId") or (resource.get("revision") or {}).get("id")
+    else:
+        fields = resource.get("fields", {})
+        work_item_id = resource.get("id")
+
+    if fields.get("System.WorkItemType") != "User Story" or work_item_id is None:
+        return None
+    return int(work_item_id)
+
+
+class StoryQueue:
+    """
+    FIFO of story ids to process. A story is queued at most once; an event
+    for a story that is being processed re-queues it when that run finishes,
+    so one story is never handled by two workers at the same time.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._active = set()
+        self._rerun = set()
+
+    def submit(self, story_id):
+        with self._lock:
+            if story_id in self._queued:
+                return
+            if story_id in self._active:
+                self._rerun.add(story_id)
+                return
+            self._queued.add(story_id)
+        self._queue.put(story_id)
+
+    def take(self, timeout=None):
+        story_id = self._queue.get(timeout=timeout)
+        if story_id is None:
+            return None
+        with self._lock:
+            self._queued.discard(story_id)
+            self._active.add(story_id)
+        return story_id
+
+    def done(self, story_id):
+        with self._lock:
+            self._active.discard(story_id)
+            requeue = story_id in self._rerun
+            self._rerun.discard(story_id)
+        if requeue:
+            self.submit(story_id)
+
+    def stop(self, workers):
+        for _ in range(workers):
+            self._queue.put(None)
+
+    def stats(self):
+        with self._lock:
+            return {"queued": len(self._queued), "active": len(self._active)}
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class ServiceHookServer(ThreadingHTTPServer):
+    """
+    Receives Azure DevOps service hook POSTs and hands the affected stories
+    to a bounded pool of worker threads running handle_story(story_id).
+    Refuses to listen beyond loopback without a secret.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, handle_story, host=SERVICE_HOOK_HOST, port=SERVICE_HOOK_PORT,
+                 workers=SERVICE_HOOK_WORKERS, secret=SERVICE_HOOK_SECRET):
+        if not secret and not is_loopback(host):
+            raise ValueError(f"refusing to accept unauthenticated service hooks on {host}; "
+                             f"set SERVICE_HOOK_SECRET or listen on 127.0.0.1")
+        super().__init__((host, port), _HookHandler)
+        self.handle_story = handle_story
+        self.secret = secret
+        self.workers = workers
+        self.stories = StoryQueue()
+        self.counters = {"received": 0, "accepted": 0, "ignored": 0, "processed": 0, "failed": 0}
+        self._counter_lock = threading.Lock()
+        self._workers = [threading.Thread(target=self._work, name=f"hook-worker-{i}", daemon=True)
+                         for i in range(workers)]
+
+    def count(self, name):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def start_workers(self):
+        for thread in self._workers:
+            thread.start()
+
+    def stop_workers(self):
+        self.stories.stop(self.workers)
+        for thread in self._workers:
+            thread.join()
+
+    def _work(self):
+        while True:
+            story_id = self.stories.take()
+            if story_id is None:
+                return
+            try:
+                self.handle_story(story_id)
+                self.count("processed")
+            except Exception as e:
+                self.count("failed")
+                print(f"failed processing story {story_id}: {e}")
+            finally:
+                self.stories.done(story_id)
+
+    def authorized(self, header):
+        if not self.secret:
+            return True
+        if not header or not header.startswith("Basic "):
+            return False
+        try:
+            _, _, password = base64.b64decode(header[6:]).decode("utf-8").partition(":")
+        except ValueError:
+            return False
+        return hmac.compare_digest(password, self.secret)
+
+
+class _HookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/health":
+            return self._reply(404, {"error": "not found"})
+        self._reply(200, {**self.server.stories.stats(), **self.server.counters})
+
+    def do_POST(self):
+        if not self.server.authorized(self.headers.get("Authorization")):
+            return self._reply(401, {"error": "unauthorized"})
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            # the body cannot be skipped without its length
+            self.close_connection = True
+            return self._reply(400, {"error": "invalid Content-Length"})
+        if length > MAX_PAYLOAD_BYTES:
+            return self._reply(413, {"error": "payload too large"})
+        try:
+            event = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._reply(400, {"error": "invalid JSON"})
+
+        self.server.count("received")
+        story_id = story_id_from_event(event) if isinstance(event, dict) else None
+        if story_id is None:
+            self.server.count("ignored")
+            return self._reply(200, {"queued": None})
+
+        self.server.stories.submit(story_id)
+        self.server.count("accepted")
+        # acknowledge right away; Azure DevOps times out slow subscribers
+        self._reply(202, {"queued": story_id})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(handle_story, host=SERVICE_HOOK_HOST, port=SERVICE_HOOK_PORT, workers=SERVICE_HOOK_WORKERS,
+          on_stop=None):
+    """Runs the receiver until interrupted."""
+    server = ServiceHookServer(handle_story, host, port, workers)
+    server.start_workers()
+    print(f"listening for service hooks on {host}:{server.server_address[1]} with {workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.stop_workers()
+        if on_stop:
+            on_stop()
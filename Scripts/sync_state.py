@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+SYNC_STATE_PATH = os.getenv("SYNC_STATE_PATH", ".cache/sync_state.json")
+# how far back the very first run (no watermark yet) looks
+SYNC_INITIAL_LOOKBACK_HOURS = float(os.getenv("SYNC_INITIAL_LOOKBACK_HOURS", "24"))
+# per-story entries are kept this long behind the watermark so our own later
+# writes to a processed story (new revisions) are still recognised
+SYNC_STATE_RETENTION_DAYS = float(os.getenv("SYNC_STATE_RETENTION_DAYS", "7"))
+
+
+def parse_ado_date(value):
+    """Parses the ISO-8601 timestamps Azure DevOps returns (with or without fractions)."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def format_ado_date(value):
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def acceptance_hash(work_item):
+    text = work_item.get("fields", {}).get("Microsoft.VSTS.Common.AcceptanceCriteria", "") or ""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SyncState:
+    """
+    Persistent checkpoint of the incremental story sync: the ChangedDate
+    watermark of the last completed run and, per story, the revision and
+    acceptance criteria hash that were last processed.
+    """
+
+    def __init__(self, path=SYNC_STATE_PATH, watermark=None, stories=None):
+        self.path = path
+        self.watermark = watermark
+        self.stories = stories or {}
+
+    @classmethod
+    def load(cls, path=SYNC_STATE_PATH):
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(path, data.get("watermark"), data.get("stories"))
+
+    def since(self):
+        """Lower ChangedDate bound for the next WIQL delta query."""
+        if self.watermark:
+            return self.watermark
+        return format_ado_date(datetime.now(timezone.utc) - timedelta(hours=SYNC_INITIAL_LOOKBACK_HOURS))
+
+    def needs_processing(self, work_item):
+        """
+        False when this revision was already processed, or when only our own
+        writes (e.g. Tested By links) changed the story since then. A story
+        moved to another Feature, or skipped for lacking a Feature or Epic,
+        is processed again on its next revision.
+        """
+        entry = self.stories.get(str(work_item["id"]))
+        if entry is None:
+            return True
+        if entry["rev"] == work_item.get("rev"):
+            return False
+        if entry.get("incomplete"):
+            return True
+        if "parent" in entry and entry["parent"] != work_item.get("fields", {}).get("System.Parent"):
+            return True
+        return entry["ac_hash"] != acceptance_hash(work_item)
+
+    def mark_processed(self, work_item, complete=True):
+        """`complete` is False when the story was skipped for a missing Feature or Epic."""
+        fields = work_item.get("fields", {})
+        entry = {
+            "rev": work_item.get("rev"),
+            "changed": fields.get("System.ChangedDate"),
+            "ac_hash": acceptance_hash(work_item),
+            "parent": fields.get("System.Parent"),
+        }
+        if not complete:
+            entry["incomplete"] = True
+        self.stories[str(work_item["id"])] = entry
+
+    def advance(self, watermark):
+        """
+        Moves the watermark forward and forgets stories processed more than
+        SYNC_STATE_RETENTION_DAYS before it.
+        """
+        if not watermark:
+            return
+        if self.watermark and parse_ado_date(watermark) <= parse_ado_date(self.watermark):
+            return
+
+        self.watermark = watermark
+        cutoff = parse_ado_date(watermark) - timedelta(days=SYNC_STATE_RETENTION_DAYS)
+        self.stories = {
+            story_id: entry for story_id, entry in self.stories.items()
+            if not entry.get("changed") or parse_ado_date(entry["changed"]) >= cutoff
+        }
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"watermark": self.watermark, "stories": self.stories}, f, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,138 @@
+from typing import Any, List, NamedTuple, Tuple
+
+from Scripts.instrumentation import metrics
+
+TEST_CASE_TYPES = ("positive", "negative", "edge")
+DEFAULT_TITLE = "AI Generated Test Case"
+
+# responseSchema (OpenAPI subset) Gemini has to follow for one story's cases
+TEST_CASE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "title": {"type": "STRING"},
+        "type": {"type": "STRING", "enum": list(TEST_CASE_TYPES)},
+        # 1-based number of the acceptance criteria scenario the case covers
+        "scenario": {"type": "INTEGER"},
+        "steps": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "action": {"type": "STRING"},
+                    "expected": {"type": "STRING"},
+                },
+                "required": ["action", "expected"],
+                "propertyOrdering": ["action", "expected"],
+            },
+        },
+    },
+    "required": ["title", "type", "scenario", "steps"],
+    "propertyOrdering": ["title", "type", "scenario", "steps"],
+}
+
+RESPONSE_SCHEMA = {"type": "ARRAY", "items": TEST_CASE_SCHEMA}
+
+# batched requests: one entry per story, since the schema cannot express story-id keys
+BATCH_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "story_id": {"type": "STRING"},
+            "test_cases": RESPONSE_SCHEMA,
+        },
+        "required": ["story_id", "test_cases"],
+        "propertyOrdering": ["story_id", "test_cases"],
+    },
+}
+
+_TYPES = frozenset(TEST_CASE_TYPES)
+
+
+class TestCase(NamedTuple):
+    """
+    A validated generated test case; steps are (action, expected) pairs and
+    scenario the 1-based acceptance criteria scenario it covers (0 = unknown).
+    """
+
+    title: str
+    type: str
+    steps: Tuple[Tuple[str, str], ...]
+    scenario: int = 0
+
+    def to_json(self):
+        return {
+            "title": self.title,
+            "type": self.type,
+            "scenario": self.scenario,
+            "steps": [{"action": action, "expected": expected} for action, expected in self.steps],
+        }
+
+
+def _string(value: Any, field: str) -> str:
+    if isinstance(value, str):
+        return value.strip()
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise ValueError(f"'{field}' is not a string: {type(value).__name__}")
+
+
+def parse_test_case(item: Any, default_type: str = "positive") -> TestCase:
+    """
+    Validates one case in a single pass over its fields. Also reads the
+    older shape with plain string steps and one case-level "expected".
+    Raises ValueError for anything that is not a usable test case.
+    """
+    if isinstance(item, TestCase):
+        return item
+    if not isinstance(item, dict):
+        raise ValueError(f"not an object: {type(item).__name__}")
+
+    title = _string(item.get("title"), "title") or DEFAULT_TITLE
+    test_type = item.get("type")
+    if test_type not in _TYPES:
+        test_type = default_type
+
+    steps = item.get("steps")
+    if steps is None:
+        steps = []
+    elif not isinstance(steps, list):
+        raise ValueError(f"'steps' is not an array: {type(steps).__name__}")
+
+    case_expected = None
+    pairs = []
+    for step in steps:
+        if isinstance(step, dict):
+            pairs.append((_string(step.get("action"), "action"), _string(step.get("expected"), "expected")))
+        else:
+            if case_expected is None:
+                case_expected = _string(item.get("expected"), "expected")
+            pairs.append((_string(step, "steps"), case_expected))
+    scenario = item.get("scenario")
+    if not isinstance(scenario, int) or isinstance(scenario, bool) or scenario < 0:
+        scenario = 0
+    return TestCase(title, test_type, tuple(pairs), scenario)
+
+
+def parse_test_cases(data: Any) -> List[TestCase]:
+    """
+    TestCase records for a generated array (or an object keyed by case
+    type). Invalid cases are reported and left out.
+    """
+    if isinstance(data, list):
+        items = [(item, "positive") for item in data]
+    elif isinstance(data, dict):
+        items = [(item, key) for key in TEST_CASE_TYPES if isinstance(data.get(key), list) for item in data[key]]
+    else:
+        raise ValueError(f"Unexpected AI JSON format: {type(data).__name__}")
+
+    cases = []
+    for n, (item, default_type) in enumerate(items, start=1):
+        try:
+            cases.append(parse_test_case(item, default_type))
+        except ValueError as e:
+            print(f"Rejected generated test case #{n}: {e}")
+            metrics.increment("test_cases_rejected")
+    return cases
@@ -0,0 +1,59 @@
+import json
+
+from Scripts.gemini_client import JsonArrayStream
+
+
+def _feed_all(chunks):
+    parser = JsonArrayStream()
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return parser, items
+
+
+def test_whole_array_in_one_chunk():
+    parser, items = _feed_all(['[{"a": 1}, {"b": 2}]'])
+    assert items == [{"a": 1}, {"b": 2}]
+    assert parser.finished
+
+
+def test_elements_are_returned_as_soon_as_complete():
+    parser = JsonArrayStream()
+    assert parser.feed('[{"title": "one", "steps"') == []
+    assert parser.feed(': []}, {"title": "tw') == [{"title": "one", "steps": []}]
+    assert parser.feed('o"}') == [{"title": "two"}]
+    assert not parser.finished
+    assert parser.feed("]") == []
+    assert parser.finished
+
+
+def test_every_split_point_gives_the_same_items():
+    expected = [{"title": "a [b]", "steps": [{"action": "x, y", "expected": "}"}]}, {"n": 2}]
+    text = json.dumps(expected)
+    for split in range(len(text) + 1):
+        parser, items = _feed_all([text[:split], text[split:]])
+        assert items == expected
+        assert parser.finished
+
+
+def test_text_before_the_array_is_ignored():
+    _, items = _feed_all(["Here you go:\n", '[{"a": 1}]'])
+    assert items == [{"a": 1}]
+
+
+def test_number_is_only_taken_once_complete():
+    parser = JsonArrayStream()
+    assert parser.feed("[12") == []
+    assert parser.feed("3, 4]") == [123, 4]
+
+
+def test_truncated_stream_is_not_finished():
+    parser, items = _feed_all(['[{"a": 1}, {"b": '])
+    assert items == [{"a": 1}]
+    assert not parser.finished
+
+
+def test_buffer_holds_only_the_partial_element():
+    parser = JsonArrayStream()
+    parser.feed('[{"a": 1}, {"b": 2}, {"c"')
+    assert parser.buffer == '{"c"'
@@ -1,53 +1,100 @@
-import requests
-import os
-from urllib.parse import quote
-
-ORG = os.getenv("AZURE_ORG")
-PROJECT = os.getenv("AZURE_PROJECT")
-PAT =   os.getenv("AZURE_PAT")
-
-AUTH = ("", PAT)
+import threading
+
+from Scripts.http_client import ado_get, ado_get_paged, ado_post, project_url
+from Scripts.project_context import ProjectScoped
+
+
+class PlanSuiteIndex:
+    """
+    In-memory name -> item index of the project's test plans and of each
+    plan's suites. Plans are listed once per run and each plan's suite tree
+    is listed once; created plans and suites are added as they are made.
+    """
+
+    def __init__(self):
+        self._plans = None
+        self._suites = {}
+        self._lock = threading.RLock()
+
+    def find_plan(self, name):
+        with self._lock:
+            if self._plans is None:
+                self._plans = {}
+                for plan in get_all_test_plans():
+                    self._plans.setdefault(plan["name"], plan)
+            return self._plans.get(name)
+
+    def add_plan(self, plan):
+        """Registers a newly created plan; its only suite is the root suite."""
+        with self._lock:
+            if self._plans is not None:
+                self._plans.setdefault(plan["name"], plan)
+            root = plan.get("rootSuite") or {}
+            self._suites.setdefault(plan["id"], {root["name"]: root} if "name" in root else {})
+
+    def find_suite(self, plan_id, name):
+        with self._lock:
+            if plan_id not in self._suites:
+                suites = {}
+                for suite in get_suites(plan_id):
+                    suites.setdefault(suite["name"], suite)
+                self._suites[plan_id] = suites
+            return self._suites[plan_id].get(name)
+
+    def add_suite(self, plan_id, suite):
+        with self._lock:
+            if plan_id in self._suites:
+                self._suites[plan_id].setdefault(suite["name"], suite)
+
+    def clear(self):
+        with self._lock:
+            self._plans = None
+            self._suites.clear()
+
+
+plan_suite_index = ProjectScoped(PlanSuiteIndex)
 
 
 def get_or_create_test_plan(epic):
 
     plan_name = f"EPIC-{epic['id']} - {epic['fields']['System.Title']}"
 
-    plans = get_all_test_plans()
-
-
-    for plan in plans:
-        if plan["name"] == plan_name:
-            return plan["id"],plan["rootSuite"]
+    plan = plan_suite_index.find_plan(plan_name)
+    if plan:
+        return plan["id"],plan["rootSuite"]
 
     return create_test_plan(plan_name)
 
 
 def get_all_test_plans():
-    url = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/testplan/plans?api-version=7.0"
+    url = project_url("testplan/plans?api-version=7.0")
 
-    res = requests.get(url, auth=AUTH)
-
-    return res.json()["value"]
+    return ado_get_paged(url)
 
 
 def get_test_plan_by_ID(ID):
-    url = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/testplan/plans/{ID}?api-version=7.0"
+    url = project_url(f"testplan/plans/{ID}?api-version=7.0")
 
-    res = requests.get(url, auth=AUTH)
+    res = ado_get(url)
+    if res.status_code != 200:
+        raise Exception(f"Fetching test plan {ID} failed: {res.status_code} {res.text}")
 
     return res.json()
 
 
 def create_test_plan(name):
 
-    url = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/testplan/plans?api-version=7.0"
+    url = project_url("testplan/plans?api-version=7.0")
 #https://dev.azure.com/{ORG}/{PROJECT}/_apis/testplan/plans?api-version=7.0
     body = {"name": name}
-    res = requests.post(url, json=body, auth=AUTH)
+    res = ado_post(url, json=body)
+    if res.status_code not in (200, 201):
+        raise Exception(f"Creating test plan '{name}' failed: {res.status_code} {res.text}")
 
+    plan = res.json()
+    plan_suite_index.add_plan(plan)
 
-    return res.json()["id"],res.json()["rootSuite"]
+    return plan["id"],plan["rootSuite"]
 
 
 # Additional functions for test suite and test case management can be added here.
@@ -55,11 +102,9 @@ def get_or_create_feature_suite(plan_id, feature,plan_root_suite):
 
     suite_name = f"FEATURE - {feature['fields']['System.Title']}"
 
-    suites = get_suites(plan_id)
-
-    for suite in suites:
-        if suite["name"] == suite_name:
-            return suite["id"]
+    suite = plan_suite_index.find_suite(plan_id, suite_name)
+    if suite:
+        return suite["id"]
 
     return create_static_suite(plan_id, suite_name,plan_root_suite)
 
@@ -69,11 +114,9 @@ def create_regression_suite(plan_id,plan_root_suite):
 
     suite_name = "Regression"
 
-    suites = get_suites(plan_id)
-
-    for suite in suites:
-        if suite["name"] == suite_name:
-            return suite["id"]
+    suite = plan_suite_index.find_suite(plan_id, suite_name)
+    if suite:
+        return suite["id"]
 
     return create_static_suite(plan_id, suite_name,plan_root_suite)
 
@@ -84,7 +127,7 @@ def create_static_suite(plan_id, name,plan_root_suite):
 # POST https://dev.azure.com{organization}/{project}/_apis/testplan/Plans/{planId}/Suites?api-version=7.1
 #GET https://dev.azure.com/{organization}/{project}/_apis/testplan/Plans/{planId}/suites?api-version=7.1
 
-    url = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/testplan/Plans/{plan_id}/suites?api-version=7.0"
+    url = project_url(f"testplan/Plans/{plan_id}/suites?api-version=7.0")
 
     body= {
     "name": name,
@@ -95,10 +138,14 @@ def create_static_suite(plan_id, name,plan_root_suite):
     }
 
 
-    res = requests.post(url, json=body, auth=AUTH)
+    res = ado_post(url, json=body)
+    if res.status_code not in (200, 201):
+        raise Exception(f"Creating suite '{name}' failed: {res.status_code} {res.text}")
 
+    suite = res.json()
+    plan_suite_index.add_suite(plan_id, suite)
 
-    return res.json()["id"]
+    return suite["id"]
 
 
 
@@ -106,11 +153,8 @@ def create_static_suite(plan_id, name,plan_root_suite):
 def get_or_create_userstory_suite(plan_id, userstory,plan_root_suite):
 
     suite_name = f"{userstory['fields']['System.Title']}"
-    suites = get_suites(plan_id)
-
-    for suite in suites:
-        if suite["name"] == suite_name:
-            return -1
+    if plan_suite_index.find_suite(plan_id, suite_name):
+        return -1
 
     return create_userstory_suite(plan_id, suite_name,userstory['id'],plan_root_suite)
 
@@ -124,7 +168,7 @@ def create_userstory_suite(plan_id, name,user_story_id,plan_root_suite):
 # POST https://dev.azure.com{organization}/{project}/_apis/testplan/Plans/{planId}/Suites?api-version=7.1
 #GET https://dev.azure.com/{organization}/{project}/_apis/testplan/Plans/{planId}/suites?api-version=7.1
 
-    url = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/testplan/Plans/{plan_id}/suites?api-version=7.0"
+    url = project_url(f"testplan/Plans/{plan_id}/suites?api-version=7.0")
 
     body= {
     "name": name,
@@ -136,34 +180,77 @@ def create_userstory_suite(plan_id, name,user_story_id,plan_root_suite):
     }
 
 
-    res = requests.post(url, json=body, auth=AUTH)
+    res = ado_post(url, json=body)
+    if res.status_code not in (200, 201):
+        raise Exception(f"Creating suite '{name}' failed: {res.status_code} {res.text}")
 
+    suite = res.json()
+    plan_suite_index.add_suite(plan_id, suite)
 
-    return res.json()["id"]
+    return suite["id"]
 
 
 
 def get_suites(plan_id):
 
     
-    url = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/testplan/plans/{plan_id}/suites?api-version=7.0"
-
-    res = requests.get(url, auth=AUTH)
+    url = project_url(f"testplan/plans/{plan_id}/suites?api-version=7.0")
 
-    return res.json()["value"]
+    return ado_get_paged(url)
 
 
 def Add_TC_to_suite(plan_id,suite_id,test_case_id):
 
+    Add_TCs_to_suite(plan_id,suite_id,[test_case_id])
+
 
-    url = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/testplan/Plans/{plan_id}/Suites/{suite_id}/TestCase?api-version=7.0"
+def Add_TCs_to_suite(plan_id,suite_id,test_case_ids):
+
+    url = project_url(f"testplan/Plans/{plan_id}/Suites/{suite_id}/TestCase?api-version=7.0")
     body = [
-    {
-        "pointAssignments": [],
-        "workItem": {
-            "id": test_case_id
+        {
+            "pointAssignments": [],
+            "workItem": {
+                "id": test_case_id
+            }
         }
-    }
-]
+        for test_case_id in test_case_ids
+    ]
+
+    res = ado_post(url, json=body)
+
+    if res.status_code not in (200, 201):
+        raise Exception(f"Adding test cases to suite {suite_id} failed: {res.status_code} {res.text}")
+
+
+def get_suite_test_case_ids(plan_id,suite_id):
+
+    url = project_url(f"testplan/Plans/{plan_id}/Suites/{suite_id}/TestCase?api-version=7.0")
+
+    return [int(tc["workItem"]["id"]) for tc in ado_get_paged(url)]
+
+
+def reconcile_regression_suite(plan_id,suite_id,test_case_ids):
+    """
+    Adds the unique test case ids that are not yet in the suite with one
+    bulk request. Returns (added, skipped) id lists.
+    """
+    wanted = list(dict.fromkeys(int(i) for i in test_case_ids))
+    if not wanted:
+        return [], []
+
+    existing = set(get_suite_test_case_ids(plan_id,suite_id))
+
+    added = [i for i in wanted if i not in existing]
+    skipped = [i for i in wanted if i in existing]
+
+    if added:
+        Add_TCs_to_suite(plan_id,suite_id,added)
+
+    return added, skipped
+
 
-    requests.post(url, json=body, auth=AUTH)
\ No newline at end of file
+def add_missing_to_suite(plan_id,suite_id,test_case_ids):
+    """Same as the regression reconcile for any suite; returns the ids that were added."""
+    added, _ = reconcile_regression_suite(plan_id,suite_id,test_case_ids)
+    return added
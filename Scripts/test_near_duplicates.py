@@ -0,0 +1,68 @@
+from Scripts.near_duplicates import CaseDuplicateIndex, NearDuplicateIndex, minhash, shingles, similarity
+
+LOGIN = ("Open the login page", "The login page is shown")
+
+
+def _steps(*pairs):
+    return [LOGIN, *pairs]
+
+
+def test_identical_texts_are_fully_similar():
+    text = "Verify login with valid credentials"
+    assert similarity(minhash(shingles(text)), minhash(shingles(text))) == 1.0
+
+
+def test_shingles_are_words_not_characters():
+    assert shingles("Submit  the FORM!") == shingles("submit the form")
+    assert shingles("submit the form") != shingles("submit the forms")
+
+
+def test_reworded_case_is_a_duplicate():
+    steps = _steps(("Enter a valid username and password and submit", "User is redirected to the dashboard"),
+                   ("Reload the page", "User is still signed in"))
+    index = CaseDuplicateIndex(threshold=0.85)
+    index.add(1, "positive", "Login with valid credentials", steps)
+    match = index.find("positive", "Check that login with valid credentials works", steps)
+    assert match is not None and match[0] == 1 and match[1] >= 0.85
+
+
+def test_cases_of_another_type_are_not_compared():
+    index = CaseDuplicateIndex(threshold=0.85)
+    steps = _steps(("Enter a valid username and password and submit", "User is redirected to the dashboard"))
+    index.add(1, "positive", "Login with valid credentials", steps)
+    assert index.find("negative", "Login with valid credentials", steps) is None
+    assert index.find("positive", "Login with valid credentials", steps)[0] == 1
+
+
+def test_untyped_cases_are_compared_with_every_type():
+    index = CaseDuplicateIndex(threshold=0.85)
+    steps = _steps(("Enter a valid username and password and submit", "User is redirected to the dashboard"))
+    index.add(("suite", 7), None, "Login with valid credentials", steps)
+    assert index.find("edge", "Login with valid credentials", steps)[0] == ("suite", 7)
+
+
+def test_different_expected_result_is_not_a_duplicate():
+    index = CaseDuplicateIndex(threshold=0.85)
+    index.add(1, "negative", "Login with a wrong password",
+              _steps(("Enter a valid username and a wrong password and submit", "An invalid credentials error is shown")))
+    assert index.find("negative", "Login with a wrong password",
+                      _steps(("Enter a valid username and a wrong password and submit",
+                              "The account is locked after the third attempt"))) is None
+
+
+def test_shared_setup_steps_do_not_make_cases_alike():
+    setup = [LOGIN, ("Enter a valid username and password and submit", "The dashboard is shown"),
+             ("Open the profile settings", "The profile settings are shown")]
+    index = CaseDuplicateIndex(threshold=0.85, shared_step_cases=3)
+    for n, title in enumerate(["Change the display name", "Change the avatar", "Change the time zone"]):
+        assert index.add_if_new(n, "positive", title, setup + [(title, "The change is saved")]) is None
+    # mostly the same setup, but a different check: not a duplicate once the setup is left out
+    assert index.find("positive", "Change the language", setup + [("Change the language", "The page is translated")]) is None
+    assert len(index) == 3
+
+
+def test_add_if_new_only_indexes_new_cases():
+    index = NearDuplicateIndex(threshold=0.85)
+    assert index.add_if_new("a", "verify the checkout total with a discount code") is None
+    assert index.add_if_new("b", "verify the checkout total with a discount code") == ("a", 1.0)
+    assert len(index) == 1
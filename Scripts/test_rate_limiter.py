@@ -0,0 +1,64 @@
+from Scripts.rate_limiter import AdaptiveRateLimiter
+
+
+def _limiter(rate=10.0, max_rate=100.0, min_rate=0.5):
+    return AdaptiveRateLimiter("test", rate, max_rate, min_rate)
+
+
+def test_success_increases_the_rate_additively():
+    limiter = _limiter(rate=10)
+    limiter.observe(200, {})
+    assert limiter.rate == 10.1
+    for _ in range(50):
+        limiter.observe(200, {})
+    assert 10.1 < limiter.rate < 15
+
+
+def test_rate_never_exceeds_the_maximum():
+    limiter = _limiter(rate=10, max_rate=10.5)
+    for _ in range(100):
+        limiter.observe(200, {})
+    assert limiter.rate == 10.5
+
+
+def test_throttling_halves_the_rate_and_pauses():
+    limiter = _limiter(rate=10)
+    limiter.observe(429, {}, retry_after=2)
+    assert limiter.rate == 5
+    assert limiter.throttled == 1
+    assert limiter.tokens == 0
+    assert limiter.paused_until > limiter._updated + 1
+
+
+def test_throttling_during_a_pause_halves_only_once():
+    limiter = _limiter(rate=10)
+    limiter.observe(429, {}, retry_after=5)
+    limiter.observe(429, {}, retry_after=5)
+    limiter.observe(429, {})
+    assert limiter.rate == 5
+    assert limiter.throttled == 3
+
+
+def test_rate_never_drops_below_the_minimum():
+    limiter = _limiter(rate=1, min_rate=0.5)
+    for _ in range(5):
+        limiter.paused_until = 0
+        limiter.observe(429, {})
+    assert limiter.rate == 0.5
+
+
+def test_rate_limit_headers_slow_down_without_pausing():
+    limiter = _limiter(rate=10)
+    limiter.observe(200, {"X-RateLimit-Limit": "1000", "X-RateLimit-Remaining": "50"})
+    assert limiter.rate == 8
+    limiter.observe(200, {"X-RateLimit-Delay": "0.5"})
+    assert limiter.rate == 6.4
+    assert limiter.throttled == 0
+    assert limiter.paused_until == 0
+
+
+def test_errors_leave_the_rate_alone():
+    limiter = _limiter(rate=10)
+    limiter.observe(500, {})
+    limiter.observe(404, {})
+    assert limiter.rate == 10
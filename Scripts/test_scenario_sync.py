@@ -0,0 +1,37 @@
+from Scripts.scenario_sync import diff_scenarios
+
+
+def test_unchanged_scenarios_keep_their_index():
+    assert diff_scenarios(["a", "b"], ["a", "b"]) == [(0, 0), (1, 1)]
+
+
+def test_added_scenario_has_no_old_index():
+    assert diff_scenarios(["a", "b"], ["a", "c", "b"]) == [(0, 0), (None, 1), (1, 2)]
+
+
+def test_removed_scenario_has_no_new_index():
+    assert diff_scenarios(["a", "b", "c"], ["a", "c"]) == [(0, 0), (2, 1), (1, None)]
+
+
+def test_edited_scenario_is_paired_with_the_old_one():
+    assert diff_scenarios(["a", "b", "c"], ["a", "x", "c"]) == [(0, 0), (1, 1), (2, 2)]
+
+
+def test_moved_scenario_is_matched_by_hash():
+    assert diff_scenarios(["a", "b", "c"], ["c", "a", "b"]) == [(2, 0), (0, 1), (1, 2)]
+
+
+def test_moved_and_edited_scenarios():
+    # "c" moved to the front, "b" was edited into "y"
+    assert diff_scenarios(["a", "b", "c"], ["c", "a", "y"]) == [(2, 0), (0, 1), (1, 2)]
+
+
+def test_duplicate_hashes_are_matched_once_each():
+    assert diff_scenarios(["a", "a"], ["a", "a", "a"]) == [(0, 0), (1, 1), (None, 2)]
+    assert diff_scenarios(["a", "a", "b"], ["a", "b"]) == [(0, 0), (2, 1), (1, None)]
+
+
+def test_empty_lists():
+    assert diff_scenarios([], ["a"]) == [(None, 0)]
+    assert diff_scenarios(["a"], []) == [(0, None)]
+    assert diff_scenarios([], []) == []
@@ -1,90 +1,233 @@
-import requests
 import os
 import json
-from typing import List, Any, Dict, Tuple
+from typing import List, Any, Callable, Dict, Optional, Sequence, Tuple, Union
+from urllib.parse import quote
+from xml.etree import ElementTree
 from xml.sax.saxutils import escape as xml_escape
 
+from Scripts.ac_preprocessor import html_to_text
+from Scripts.azure_client import get_work_item_raw, get_work_items_batch
+from Scripts.http_client import ado_delete, ado_patch, ado_post, org_url, project_url
+from Scripts.project_context import current_project
+from Scripts.instrumentation import metrics
+from Scripts.near_duplicates import CaseDuplicateIndex
+from Scripts.test_case_schema import TEST_CASE_TYPES, TestCase, parse_test_case, parse_test_cases
+from Scripts.test_management import get_suite_test_case_ids
+from Scripts.work_item_cache import work_item_cache
+
 # ================================
 # ENV & CONSTANTS
 # ================================
-ORG = os.getenv("AZURE_ORG")
-PROJECT = os.getenv("AZURE_PROJECT")
-PAT = os.getenv("AZURE_PAT")
 ASSIGNED_TO = os.getenv("AZURE_EMAIL")
 
-AUTH = ("", PAT or "")
+# the WIT $batch endpoint accepts at most 200 operations per call
+WIT_BATCH_SIZE = 200
 
-BASE_WIT_URL = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/wit"
-BASE_TESTPLAN_URL = f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/testplan"
+# when cases arrive from a stream, publish them in groups of this size
+STREAM_PUBLISH_CHUNK = int(os.getenv("STREAM_PUBLISH_CHUNK", "4"))
 
 
 # ================================
 # PUBLIC ENTRY
 # ================================
-def create_test_cases(story: Dict[str, Any], tests_json: Any, plan_id: int, suite_id: int):
+def create_test_cases(story: Dict[str, Any], tests_json: Any, plan_id: int, suite_id: int,
+                      already_created: Optional[Dict[int, int]] = None,
+                      on_created: Optional[Callable[[List[Tuple[int, int]]], None]] = None,
+                      on_linked: Optional[Callable[[List[int]], None]] = None,
+                      suite_is_new: bool = False,
+                      on_generated: Optional[Callable[[List[Tuple[int, TestCase]]], None]] = None) -> List[int]:
     """
     Main entry point:
-    - Creates test case work items
-    - Links them to suite
-    - Links them to user story
-    """
-
-    # Normalize AI output - allow flat list or dict with type keys
-    if isinstance(tests_json, list):
-        all_cases = tests_json
-    elif isinstance(tests_json, dict):
-        all_cases = []
-        for key in ("positive", "negative", "edge"):
-            if key in tests_json and isinstance(tests_json[key], list):
-                all_cases.extend(tests_json[key])
-    else:
-        raise Exception("Unexpected AI JSON format: " + str(type(tests_json)))
+    - Drops near-duplicate cases (within the story and against the suite)
+    - Creates test case work items already linked to the user story
+      (one $batch call per 200 cases)
+    - Adds all created cases to the suite in a single call
+    tests_json holds TestCase records (raw generated JSON is validated
+    first); it may also be an iterator of records (streamed generation),
+    published in groups of STREAM_PUBLISH_CHUNK while the rest still arrive.
+    Cases whose 1-based index is in already_created are not created again.
+    on_created receives [(index, id), ...] right after each creation call and
+    on_linked the ids once they are in the suite, so a journal can resume.
+    on_generated receives each streamed group of [(index, case), ...] before
+    it is published.
+    suite_is_new skips reading the suite's existing cases (it has none).
+    Returns the ids of the created test cases.
+    """
+    context = _PublishContext(already_created, on_created, on_linked, on_generated)
+    if not suite_is_new:
+        _index_suite_cases(context.duplicates, plan_id, suite_id)
+
+    if hasattr(tests_json, "__next__"):
+        created_ids = _create_streamed_test_cases(story, tests_json, plan_id, suite_id, context)
+        context.report(story["id"])
+        return created_ids
+
+    all_cases = parse_test_cases(tests_json)
 
     if not all_cases:
         print("No test cases to create (empty AI output).")
+        return []
+
+    created_ids = _publish(story, list(enumerate(all_cases, start=1)), plan_id, suite_id, context)
+    context.report(story["id"])
+    return created_ids
+
+
+class _PublishContext:
+    """State shared by the publish calls of one create_test_cases run."""
+
+    def __init__(self, already_created=None, on_created=None, on_linked=None, on_generated=None):
+        self.already_created = already_created or {}
+        self.on_created = on_created
+        self.on_linked = on_linked
+        self.on_generated = on_generated
+        self.duplicates = CaseDuplicateIndex()
+        self.dropped = {"story": 0, "suite": 0}
+
+    def is_duplicate(self, idx: int, tc: TestCase) -> bool:
+        match = self.duplicates.add_if_new(("story", idx), tc.type, tc.title, tc.steps)
+        if match is None:
+            return False
+        (source, key), score = match
+        self.dropped[source] += 1
+        where = f"test case #{key}" if source == "story" else f"suite test case {key}"
+        print(f"Dropping test case #{idx} ({score:.2f} similar to {where}): {tc.title}")
+        return True
+
+    def report(self, story_id: int):
+        if any(self.dropped.values()):
+            print(f"dropped near-duplicates for story {story_id}: "
+                  f"{self.dropped['story']} within the story, {self.dropped['suite']} already in the suite")
+        metrics.increment("duplicates_dropped_in_story", self.dropped["story"])
+        metrics.increment("duplicates_dropped_in_suite", self.dropped["suite"])
+
+
+def _index_suite_cases(index: CaseDuplicateIndex, plan_id: int, suite_id: int):
+    ids = get_suite_test_case_ids(plan_id, suite_id)
+    if not ids:
         return
+    fields_wanted = ["System.Title", "System.Tags", "Microsoft.VSTS.TCM.Steps"]
+    for item in get_work_items_batch(ids, fields=fields_wanted):
+        fields = item.get("fields", {})
+        # generated cases are tagged "AI_Generated; <type>"; others stay untyped
+        tags = [tag.strip().lower() for tag in (fields.get("System.Tags") or "").split(";")]
+        case_type = next((tag for tag in tags if tag in TEST_CASE_TYPES), None)
+        pairs = parse_test_steps_xml(fields.get("Microsoft.VSTS.TCM.Steps", ""))
+        index.add(("suite", item["id"]), case_type, fields.get("System.Title", ""), pairs)
+
+
+def _create_streamed_test_cases(story: Dict[str, Any], cases: Any, plan_id: int, suite_id: int,
+                                context: "_PublishContext") -> List[int]:
+    created_ids: List[int] = []
+    pending = []
+    seen = False
+
+    for idx, tc in enumerate(cases, start=1):
+        seen = True
+        pending.append((idx, tc))
+        if len(pending) >= STREAM_PUBLISH_CHUNK:
+            created_ids.extend(_publish_streamed(story, pending, plan_id, suite_id, context))
+            pending = []
+
+    if pending:
+        created_ids.extend(_publish_streamed(story, pending, plan_id, suite_id, context))
+    elif not seen:
+        print("No test cases to create (empty AI output).")
 
-    for idx, tc in enumerate(all_cases, start=1):
-        try:
-            if not isinstance(tc, dict):
-                raise ValueError(f"Test case #{idx} is not an object: {type(tc)}")
+    return created_ids
+
+
+def _publish_streamed(story: Dict[str, Any], numbered_cases: List[Tuple[int, TestCase]], plan_id: int,
+                      suite_id: int, context: "_PublishContext") -> List[int]:
+    # recorded first, so created indexes always refer to known cases
+    if context.on_generated:
+        context.on_generated(numbered_cases)
+    return _publish(story, numbered_cases, plan_id, suite_id, context)
+
+
+def _publish(story: Dict[str, Any], numbered_cases: List[Tuple[int, TestCase]], plan_id: int, suite_id: int,
+             context: "_PublishContext") -> List[int]:
+    valid_cases = []
+    for idx, tc in numbered_cases:
+        if idx in context.already_created:
+            # published by an earlier run; later cases must not repeat it
+            context.duplicates.add(("story", idx), tc.type, tc.title, tc.steps)
+            continue
+        if context.is_duplicate(idx, tc):
+            continue
+        valid_cases.append((idx, tc))
+
+    if not valid_cases:
+        return []
+
+    created = []
+    results = create_test_case_work_items_batch([tc for _, tc in valid_cases], story["id"])
+    for (idx, tc), result in zip(valid_cases, results):
+        if isinstance(result, Exception):
+            _report_failure(idx, result, tc)
+        else:
+            created.append((idx, result))
+
+    created_ids = [test_case_id for _, test_case_id in created]
 
-            test_case_id = create_test_case_work_item(tc)
-            if test_case_id:
-                link_test_to_suite(test_case_id, plan_id, suite_id)
-                link_test_case_to_story(test_case_id, story["id"])
+    if created_ids:
+        if context.on_created:
+            context.on_created(created)
+
+        try:
+            link_tests_to_suite(created_ids, plan_id, suite_id)
+            if context.on_linked:
+                context.on_linked(created_ids)
         except Exception as e:
-            print(f"Failed creating test case #{idx}: {e}\nPayload:\n{json.dumps(tc, indent=2, ensure_ascii=False)}")
+            print(f"Failed adding test cases {created_ids} to suite {suite_id}: {e}")
 
+        # the story gained TestedBy relations and a revision
+        work_item_cache.invalidate(story["id"])
+
+    return created_ids
+
+
+def _report_failure(idx: int, error: Exception, tc: TestCase):
+    print(f"Failed creating test case #{idx}: {error}\nPayload:\n{json.dumps(tc.to_json(), indent=2, ensure_ascii=False)}")
 
 
 
 # ================================
 # CREATE TEST CASE WORK ITEM
 # ================================
-def create_test_case_work_item(test_case: Dict[str, Any]) -> int:
+def build_test_case_patch(test_case: Union[TestCase, Dict[str, Any]], story_id: int = None) -> List[Dict[str, Any]]:
     """
-    Creates Azure DevOps Test Case Work Item.
+    JSON patch document for a new Test Case; with story_id the Tested By
+    link is part of the creation instead of a separate PATCH. A generated
+    JSON object is validated into a TestCase first (ValueError if unusable).
     """
-    title = _to_str(test_case.get("title", "AI Generated Test Case"))
-    test_type = test_case.get("type", "positive")
-    pairs = normalize_to_pairs(test_case)
-    steps_xml = build_test_steps_xml_from_pairs(pairs)
+    test_case = parse_test_case(test_case)
+    steps_xml = build_test_steps_xml_from_pairs(test_case.steps)
 
     patch_document = [
-        {"op": "add", "path": "/fields/System.Title", "value": title},
+        {"op": "add", "path": "/fields/System.Title", "value": test_case.title},
         {"op": "add", "path": "/fields/System.AssignedTo", "value": ASSIGNED_TO or ""},
         {"op": "add", "path": "/fields/Microsoft.VSTS.TCM.Steps", "value": steps_xml},
-        {"op": "add", "path": "/fields/System.Tags", "value": f"AI_Generated;{test_type}"},
+        {"op": "add", "path": "/fields/System.Tags", "value": f"AI_Generated;{test_case.type}"},
     ]
 
-    url = f"{BASE_WIT_URL}/workitems/$Test%20Case?api-version=7.0"
-    response = requests.post(
+    if story_id is not None:
+        patch_document.append(_tested_by_relation(story_id))
+
+    return patch_document
+
+
+def create_test_case_work_item(test_case: Union[TestCase, Dict[str, Any]], story_id: int = None) -> int:
+    """
+    Creates Azure DevOps Test Case Work Item.
+    """
+    patch_document = build_test_case_patch(test_case, story_id)
+
+    url = project_url("wit/workitems/$Test%20Case?api-version=7.0")
+    response = ado_post(
         url,
-        headers={"Content-Type": "application/json-patch+json", "Accept": "application/json"},
-        auth=AUTH,
+        headers={"Content-Type": "application/json-patch+json"},
         data=json.dumps(patch_document),
-        timeout=30,
     )
 
     if response.status_code not in (200, 201):
@@ -93,10 +236,126 @@ def create_test_case_work_item(test_case: Dict[str, Any]) -> int:
     return int(response.json()["id"])
 
 
+def create_test_case_work_items_batch(test_cases: List[TestCase], story_id: int = None) -> List[Any]:
+    """
+    Creates Test Case work items through the WIT $batch endpoint.
+    Returns one entry per input: the new id, or the Exception for that item.
+    """
+    operations = []
+    for tc in test_cases:
+        try:
+            operations.append(_batch_operation("$Test%20Case", build_test_case_patch(tc, story_id)))
+        except Exception as e:
+            operations.append(e)
+    return _send_wit_batch(operations, "creation")
+
+
+def update_test_case_work_items(updates: List[Tuple[int, TestCase]]) -> List[Any]:
+    """
+    Rewrites the title, steps and tags of existing Test Cases, given as
+    [(work item id, new content), ...], through the WIT $batch endpoint.
+    Returns one entry per input: the id, or the Exception for that item.
+    """
+    operations = []
+    for test_case_id, tc in updates:
+        patch_document = [op for op in build_test_case_patch(tc) if op["path"] != "/fields/System.AssignedTo"]
+        operations.append(_batch_operation(str(test_case_id), patch_document))
+    return _send_wit_batch(operations, "update")
+
+
+def close_test_case_work_items(test_case_ids: List[int]) -> List[Any]:
+    """Moves Test Cases to the Closed state; one id or Exception per input."""
+    patch_document = [{"op": "add", "path": "/fields/System.State", "value": "Closed"}]
+    return _send_wit_batch([_batch_operation(str(i), patch_document) for i in test_case_ids], "update")
+
+
+def _batch_operation(work_item: str, patch_document: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "method": "PATCH",
+        "uri": f"/{quote(current_project().project or '')}/_apis/wit/workitems/{work_item}?api-version=7.0",
+        "headers": {"Content-Type": "application/json-patch+json"},
+        "body": patch_document,
+    }
+
+
+def _send_wit_batch(operations: List[Any], action: str) -> List[Any]:
+    """
+    Sends the operations (Exceptions are passed through) in $batch calls of
+    WIT_BATCH_SIZE; returns one work item id or Exception per operation.
+    """
+    results: List[Any] = []
+    url = org_url("wit/$batch?api-version=7.0")
+
+    for start in range(0, len(operations), WIT_BATCH_SIZE):
+        chunk = operations[start:start + WIT_BATCH_SIZE]
+        requests_to_send = [op for op in chunk if not isinstance(op, Exception)]
+        responses = iter([])
+        if requests_to_send:
+            response = ado_post(url, json=requests_to_send)
+            if response.status_code != 200:
+                error = Exception(f"Work item batch {action} failed: {response.status_code} {response.text}")
+                results.extend(error for _ in chunk)
+                continue
+            responses = iter(response.json().get("value", []))
+
+        for op in chunk:
+            if isinstance(op, Exception):
+                results.append(op)
+                continue
+            results.append(_batch_item_result(next(responses, None), action))
+
+    return results
+
+
+def _batch_item_result(item: Any, action: str = "creation") -> Any:
+    if item is None:
+        return Exception(f"Work item {action} failed: missing $batch response")
+
+    body = item.get("body")
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            pass
+
+    if item.get("code") not in (200, 201) or not isinstance(body, dict) or "id" not in body:
+        return Exception(f"Work item {action} failed: {item.get('code')} {body}")
+
+    return int(body["id"])
+
+
+def find_existing_test_cases(story_id: int, test_cases: List[TestCase]) -> Dict[int, int]:
+    """
+    Matches generated cases (by title) against Test Cases already linked to
+    the story as Tested By. Used when a previous run died between creating
+    work items and recording their ids. Returns {1-based index: id}.
+    """
+    work_item_cache.invalidate(story_id)
+    story = get_work_item_raw(story_id)
+    linked_ids = [
+        rel["url"].rstrip("/").split("/")[-1]
+        for rel in story.get("relations", [])
+        if rel["rel"] == "Microsoft.VSTS.Common.TestedBy-Forward"
+    ]
+    if not linked_ids:
+        return {}
+
+    by_title: Dict[str, List[int]] = {}
+    for item in get_work_items_batch(linked_ids, expand="Relations"):
+        by_title.setdefault(item["fields"].get("System.Title", ""), []).append(item["id"])
+
+    found = {}
+    for idx, tc in enumerate(test_cases, start=1):
+        ids = by_title.get(tc.title)
+        if ids:
+            found[idx] = ids.pop(0)
+    return found
+
+
 # ================================
 # BUILD AZURE TEST STEP XML
 # ================================
-def build_test_steps_xml_from_pairs(pairs: List[Tuple[str, str]]) -> str:
+def build_test_steps_xml_from_pairs(pairs: Sequence[Tuple[str, str]]) -> str:
     """
     Builds the XML expected by Microsoft.VSTS.TCM.Steps.
     """
@@ -123,6 +382,25 @@ def build_test_steps_xml_from_pairs(pairs: List[Tuple[str, str]]) -> str:
     return "".join(xml_parts)
 
 
+def parse_test_steps_xml(steps_xml: str) -> List[Tuple[str, str]]:
+    """
+    Reads [(action, expected), ...] back from a Microsoft.VSTS.TCM.Steps value.
+    """
+    if not steps_xml:
+        return []
+    try:
+        root = ElementTree.fromstring(steps_xml)
+    except ElementTree.ParseError:
+        return []
+
+    pairs = []
+    for step in root.iter("step"):
+        strings = [html_to_text(p.text or "").strip() for p in step.findall("parameterizedString")]
+        strings += ["", ""]
+        pairs.append((strings[0], strings[1]))
+    return pairs
+
+
 # ================================
 # LINK TEST CASE TO TEST SUITE
 # ================================
@@ -130,21 +408,35 @@ def link_test_to_suite(test_case_id: int, plan_id: int, suite_id: int):
     """
     Adds a test case to a suite using the testplan REST API.
     """
-    url = f"{BASE_TESTPLAN_URL}/Plans/{plan_id}/Suites/{suite_id}/TestCase?api-version=7.1"
-    payload = {"workItemIds": [test_case_id]}
+    link_tests_to_suite([test_case_id], plan_id, suite_id)
 
-    response = requests.post(
-        url,
-        auth=AUTH,
-        headers={"Content-Type": "application/json", "Accept": "application/json"},
-        data=json.dumps(payload),
-        timeout=30,
-    )
+
+def link_tests_to_suite(test_case_ids: List[int], plan_id: int, suite_id: int):
+    """
+    Adds several test cases to a suite in one testplan REST call.
+    """
+    url = project_url(f"testplan/Plans/{plan_id}/Suites/{suite_id}/TestCase?api-version=7.1")
+    payload = {"workItemIds": list(test_case_ids)}
+
+    response = ado_post(url, json=payload)
 
     if response.status_code not in (200, 201):
         raise Exception(f"Suite link failed: {response.status_code} {response.text}")
 
 
+def remove_tests_from_suite(test_case_ids: List[int], plan_id: int, suite_id: int):
+    """
+    Removes test cases from a suite (the work items themselves stay).
+    """
+    ids = ",".join(str(i) for i in test_case_ids)
+    url = project_url(f"testplan/Plans/{plan_id}/Suites/{suite_id}/TestCase?testCaseIds={ids}&api-version=7.0")
+
+    response = ado_delete(url)
+
+    if response.status_code not in (200, 204):
+        raise Exception(f"Suite removal failed: {response.status_code} {response.text}")
+
+
 # ================================
 # LINK TEST CASE TO USER STORY
 # ================================
@@ -152,68 +444,29 @@ def link_test_case_to_story(test_case_id: int, story_id: int):
     """
     Adds Tested By relation (reverse link to the story).
     """
-    patch_document = [
-        {
-            "op": "add",
-            "path": "/relations/-",
-            "value": {
-                "rel": "Microsoft.VSTS.Common.TestedBy-Reverse",
-                "url": f"{BASE_WIT_URL}/workItems/{story_id}",
-            },
-        }
-    ]
+    patch_document = [_tested_by_relation(story_id)]
 
-    url = f"{BASE_WIT_URL}/workitems/{test_case_id}?api-version=7.0"
-    response = requests.patch(
+    url = project_url(f"wit/workitems/{test_case_id}?api-version=7.0")
+    response = ado_patch(
         url,
-        headers={"Content-Type": "application/json-patch+json", "Accept": "application/json"},
-        auth=AUTH,
+        headers={"Content-Type": "application/json-patch+json"},
         data=json.dumps(patch_document),
-        timeout=30,
     )
 
     if response.status_code not in (200, 201):
         raise Exception(f"Story link failed: {response.status_code} {response.text}")
 
+    # the story gained a relation and a revision; drop the stale copy
+    work_item_cache.invalidate(story_id)
 
-# ================================
-# NORMALIZATION HELPERS
-# ================================
-def _to_str(x: Any) -> str:
-    """
-    Convert any value into a single-line string representation.
-    """
-    if x is None:
-        return ""
-    if isinstance(x, str):
-        return x
-    if isinstance(x, list):
-        return " ".join(_to_str(i) for i in x if i is not None)
-    if isinstance(x, dict):
-        for k in ("text", "title", "action", "step", "description", "value"):
-            if k in x:
-                return _to_str(x[k])
-        return json.dumps(x, ensure_ascii=False)
-    return str(x)
 
+def _tested_by_relation(story_id: int) -> Dict[str, Any]:
+    return {
+        "op": "add",
+        "path": "/relations/-",
+        "value": {
+            "rel": "Microsoft.VSTS.Common.TestedBy-Reverse",
+            "url": project_url(f"wit/workItems/{story_id}"),
+        },
+    }
 
-def normalize_to_pairs(test_case: Dict[str, Any]) -> List[Tuple[str, str]]:
-    """
-    Produce [(action, expected), ...] from a single test_case dict.
-    """
-    default_expected = _to_str(test_case.get("expected", ""))
-    steps = test_case.get("steps", [])
-
-    if not isinstance(steps, list):
-        steps = [steps]
-
-    pairs: List[Tuple[str, str]] = []
-    for s in steps:
-        if isinstance(s, dict):
-            action = _to_str(s.get("action") or s.get("step") or s.get("description") or s)
-            exp = _to_str(s.get("expected") or s.get("result") or default_expected)
-        else:
-            action = _to_str(s)
-            exp = default_expected
-        pairs.append((action.strip(), exp.strip()))
-    return pairs
@@ -0,0 +1,79 @@
+import os
+import threading
+from collections import OrderedDict
+
+from Scripts.project_context import ProjectScoped
+
+WORK_ITEM_CACHE_SIZE = int(os.getenv("WORK_ITEM_CACHE_SIZE", "2048"))
+
+
+class WorkItemCache:
+    """
+    Bounded LRU identity map of raw work items, keyed by (id, rev).
+    Only the newest revision of each id is served by get().
+    """
+
+    def __init__(self, max_size=WORK_ITEM_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def get(self, work_id):
+        with self._lock:
+            rev = self._latest.get(int(work_id))
+            if rev is None:
+                self.misses += 1
+                return None
+            key = (int(work_id), rev)
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+
+    def put(self, work_item):
+        work_id = int(work_item["id"])
+        rev = work_item.get("rev", 0)
+
+        with self._lock:
+            current = self._latest.get(work_id)
+            if current is not None:
+                if current > rev:
+                    return
+                self._items.pop((work_id, current), None)
+
+            self._items[(work_id, rev)] = work_item
+            self._latest[work_id] = rev
+
+            while len(self._items) > self.max_size:
+                (old_id, _), _ = self._items.popitem(last=False)
+                self._latest.pop(old_id, None)
+
+    def invalidate(self, work_id):
+        with self._lock:
+            rev = self._latest.pop(int(work_id), None)
+            if rev is not None:
+                self._items.pop((int(work_id), rev), None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._latest.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# Shared by every fetch path in Scripts/ for the lifetime of one run, one per project
+work_item_cache = ProjectScoped(WorkItemCache)
@@ -0,0 +1,594 @@
+"""
+Local stand-in for the Azure DevOps and Gemini endpoints used by Scripts/.
+
+It serves a generated backlog (Epics -> Features -> User Stories, plus a pool
+of existing Test Cases that stories link as Related), keeps the test plans,
+suites and created test cases in memory, and counts every call per endpoint.
+Latency, rate limiting and page sizes are configurable.
+
+    python -m benchmarks.mock_server --stories 100 --port 8765
+"""
+import argparse
+import json
+import random
+import re
+import socket
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+ORG = "bench"
+PROJECT = "Bench"
+# flat WIQL queries matching more work items than this fail, as in Azure DevOps
+WIQL_MAX_RESULTS = 20000
+
+SCENARIOS = [
+    "Scenario: User registers with a valid email Given the user is on the registration page "
+    "When the user enters a valid email and password And clicks register Then the account is created",
+    "Scenario: User enters an invalid email Given the user is on the registration page "
+    "When the user enters invalid-email Then an error message is displayed",
+    "Scenario: User updates the order amount Given an order exists When the user sets the amount to 0 "
+    "Then the price total is recalculated",
+    "Scenario: Password reset Given the user forgot the password When a reset is requested "
+    "Then a reset mail is sent before the expiry date",
+]
+
+_FEATURES = ("login form", "search results", "checkout cart", "profile settings", "password reset",
+             "order history", "invoice export", "notification centre", "file upload", "admin dashboard",
+             "shipping address", "two factor prompt", "registration page", "order amount")
+_INPUTS = ("a valid email", "an empty field", "a 256 character name", "an expired token", "a negative amount",
+           "unicode characters", "a duplicate record", "a leap day date", "a locked account", "no network")
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class MockConfig:
+    def __init__(self, stories=10, stories_per_feature=5, features_per_epic=4, related_per_story=2,
+                 test_case_pool=50, cases_per_story=10, ado_latency=0.005, gemini_latency=0.05,
+                 rate_limit=0, page_size=100, seed=7, paraphrase_every=5, gemini_tail_every=0,
+                 gemini_tail_latency=2.0):
+        self.stories = stories
+        self.stories_per_feature = stories_per_feature
+        self.features_per_epic = features_per_epic
+        self.related_per_story = related_per_story
+        self.test_case_pool = test_case_pool
+        self.cases_per_story = cases_per_story
+        self.ado_latency = ado_latency
+        self.gemini_latency = gemini_latency
+        # requests per second across all endpoints; 0 disables throttling
+        self.rate_limit = rate_limit
+        self.page_size = page_size
+        self.seed = seed
+        # every n-th generated case rewords the one before it, like Gemini often does; 0 disables
+        self.paraphrase_every = paraphrase_every
+        # every n-th Gemini request takes gemini_tail_latency instead, like a stuck response; 0 disables
+        self.gemini_tail_every = gemini_tail_every
+        self.gemini_tail_latency = gemini_tail_latency
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{k: v for k, v in data.items() if k in cls().__dict__})
+
+
+class MockBackend:
+    """In-memory Azure DevOps project plus call counters."""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.RLock()
+        self.calls = Counter()
+        self.throttled = 0
+        self.gemini_requests = 0
+        self.items = {}
+        self.plans = {}
+        self.suites = {}
+        self.suite_cases = defaultdict(list)
+        self._next_id = 1
+        self._bucket = float(config.rate_limit)
+        self._bucket_at = time.monotonic()
+        self._generate(random.Random(config.seed))
+
+    # ----------------------------------------------------------- backlog
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id - 1
+
+    def _add_item(self, work_item_type, title, extra_fields=None):
+        work_id = self._new_id()
+        fields = {
+            "System.Id": work_id,
+            "System.WorkItemType": work_item_type,
+            "System.Title": title,
+            "System.AreaPath": PROJECT,
+            "System.ChangedDate": _now(),
+            "System.CreatedDate": _now(),
+        }
+        fields.update(extra_fields or {})
+        self.items[work_id] = {"id": work_id, "rev": 1, "fields": fields, "relations": []}
+        return work_id
+
+    def _link(self, source, rel, target, name):
+        self.items[source]["relations"].append({
+            "rel": rel,
+            "url": f"https://dev.azure.com/{ORG}/{PROJECT}/_apis/wit/workItems/{target}",
+            "attributes": {"name": name},
+        })
+
+    def _generate(self, rng):
+        cfg = self.config
+        pool = []
+        for n in range(cfg.test_case_pool):
+            feature = _FEATURES[n % len(_FEATURES)]
+            given = _INPUTS[(n // len(_FEATURES)) % len(_INPUTS)]
+            pool.append(self._add_item("Test Case", f"Existing case: {feature} with {given}", {
+                "Microsoft.VSTS.TCM.Steps": "<steps id=\"0\" last=\"1\"><step id=\"1\" type=\"ValidateStep\">"
+                                            f"<parameterizedString isformatted=\"true\">Open the {feature} and enter {given}</parameterizedString>"
+                                            "<parameterizedString isformatted=\"true\">It passes</parameterizedString>"
+                                            "<description/></step></steps>",
+            }))
+
+        feature_count = max(1, -(-cfg.stories // cfg.stories_per_feature))
+        epic_count = max(1, -(-feature_count // cfg.features_per_epic))
+        epics = [self._add_item("Epic", f"Epic {n}") for n in range(epic_count)]
+        features = []
+        for n in range(feature_count):
+            epic = epics[n // cfg.features_per_epic]
+            feature = self._add_item("Feature", f"Feature {n}", {"System.Parent": epic})
+            self._link(feature, "System.LinkTypes.Hierarchy-Reverse", epic, "Parent")
+            self._link(epic, "System.LinkTypes.Hierarchy-Forward", feature, "Child")
+            features.append(feature)
+
+        for n in range(cfg.stories):
+            criteria = "".join(
+                f"<div>{scenario}</div>" for scenario in rng.sample(SCENARIOS, 2)
+            )
+            feature = features[n // cfg.stories_per_feature]
+            story = self._add_item("User Story", f"Story {n}", {
+                "System.Description": f"<p>Story {n} description</p>",
+                "Microsoft.VSTS.Common.AcceptanceCriteria": f"<div>Story {n}</div>{criteria}",
+                "System.Parent": feature,
+                # two teams, alternating per Epic
+                "System.AreaPath": f"{PROJECT}\\Team {(n // cfg.stories_per_feature // cfg.features_per_epic) % 2}",
+            })
+            self._link(story, "System.LinkTypes.Hierarchy-Reverse", feature, "Parent")
+            self._link(feature, "System.LinkTypes.Hierarchy-Forward", story, "Child")
+            for test_case in rng.sample(pool, min(cfg.related_per_story, len(pool))):
+                self._link(story, "System.LinkTypes.Related", test_case, "Related")
+                self._link(test_case, "System.LinkTypes.Related", story, "Related")
+
+    # ----------------------------------------------------------- throttling
+    def take_token(self):
+        """Returns seconds to wait when the rate limit is exhausted, else 0."""
+        rate = self.config.rate_limit
+        if not rate:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self._bucket = min(rate, self._bucket + (now - self._bucket_at) * rate)
+            self._bucket_at = now
+            if self._bucket >= 1:
+                self._bucket -= 1
+                return 0
+            self.throttled += 1
+            return (1 - self._bucket) / rate
+
+    def remaining(self):
+        return int(self._bucket) if self.config.rate_limit else None
+
+    def gemini_latency(self):
+        with self.lock:
+            self.gemini_requests += 1
+            n = self.gemini_requests
+        tail = self.config.gemini_tail_every
+        return self.config.gemini_tail_latency if tail and n % tail == 0 else self.config.gemini_latency
+
+    # ----------------------------------------------------------- work items
+    def touch(self, work_id):
+        item = self.items[work_id]
+        item["rev"] += 1
+        item["fields"]["System.ChangedDate"] = _now()
+
+    def create_work_item(self, work_item_type, patch_document):
+        fields = {}
+        relations = []
+        for op in patch_document:
+            if op["path"].startswith("/fields/"):
+                fields[op["path"][len("/fields/"):]] = op["value"]
+            elif op["path"].startswith("/relations"):
+                relations.append(op["value"])
+
+        work_id = self._add_item(work_item_type, fields.pop("System.Title", ""), fields)
+        self.apply_relations(work_id, relations)
+        return self.items[work_id]
+
+    def update_work_item(self, work_id, patch_document):
+        for op in patch_document:
+            if op["path"].startswith("/fields/"):
+                self.items[work_id]["fields"][op["path"][len("/fields/"):]] = op["value"]
+        self.apply_relations(work_id, [op["value"] for op in patch_document if op["path"].startswith("/relations")])
+        self.touch(work_id)
+        return self.items[work_id]
+
+    def apply_relations(self, work_id, relations):
+        for relation in relations:
+            target = int(relation["url"].rstrip("/").split("/")[-1])
+            self.items[work_id]["relations"].append(dict(relation, attributes={"name": relation["rel"]}))
+            if relation["rel"] == "Microsoft.VSTS.Common.TestedBy-Reverse" and target in self.items:
+                self._link(target, "Microsoft.VSTS.Common.TestedBy-Forward", work_id, "Tested By")
+                self.touch(target)
+
+    def view(self, work_id, expand=None, fields=None):
+        item = self.items[work_id]
+        out = {"id": item["id"], "rev": item["rev"], "fields": dict(item["fields"])}
+        if fields:
+            out["fields"] = {k: v for k, v in item["fields"].items() if k in fields}
+        if expand and expand.lower() in ("relations", "all"):
+            out["relations"] = list(item["relations"])
+        return out
+
+    # ----------------------------------------------------------- WIQL
+    def wiql(self, query, top=0):
+        if "FROM WorkItemLinks" in query:
+            return {"workItemRelations": self._link_query(query)}
+
+        matches = [item for item in self.items.values() if self._matches(item, query)]
+        if not top and len(matches) > WIQL_MAX_RESULTS:
+            raise ValueError(f"VS402337: The number of work items returned exceeds the size limit of {WIQL_MAX_RESULTS}.")
+        if "ORDER BY [System.Id]" in query:
+            matches.sort(key=lambda item: item["id"])
+        elif "ORDER BY [System.ChangedDate]" in query:
+            matches.sort(key=lambda item: item["fields"]["System.ChangedDate"])
+        if top:
+            matches = matches[:top]
+        return {"asOf": _now(), "workItems": [{"id": item["id"]} for item in matches]}
+
+    def _matches(self, item, query):
+        fields = item["fields"]
+        for work_item_type in re.findall(r"\[System\.WorkItemType\] = '([^']+)'", query):
+            if fields["System.WorkItemType"] != work_item_type:
+                return False
+        for field, op, value in re.findall(r"\[(System\.\w+Date)\] (>=|>|<=|<) '([^']+)'", query):
+            if not _compare(fields[field], op, value):
+                return False
+        for op, value in re.findall(r"\[System\.Id\] (>=|>|<=|<) (\d+)", query):
+            if not _compare(item["id"], op, int(value)):
+                return False
+        for ids in re.findall(r"\[System\.Parent\] IN \(([^)]*)\)", query):
+            if fields.get("System.Parent") not in {int(i) for i in ids.split(",")}:
+                return False
+        for path in re.findall(r"\[System\.AreaPath\] UNDER '((?:[^']|'')*)'", query):
+            path = path.replace("''", "'")
+            if fields["System.AreaPath"] != path and not fields["System.AreaPath"].startswith(path + "\\"):
+                return False
+        return True
+
+    def _link_query(self, query):
+        source_ids = [int(i) for i in re.search(r"\[Source\]\.\[System\.Id\] IN \(([^)]*)\)", query).group(1).split(",")]
+        link_types = re.findall(r"'(System\.LinkTypes\.[\w-]+)'", query)
+        target_clause = query.split("[Target].[System.WorkItemType]", 1)[1]
+        target_types = re.findall(r"'([^']+)'", target_clause.split(")")[0])
+
+        relations = [{"rel": None, "source": None, "target": {"id": i}} for i in source_ids if i in self.items]
+        for source in source_ids:
+            for relation in self.items.get(source, {}).get("relations", []):
+                target = int(relation["url"].rstrip("/").split("/")[-1])
+                if relation["rel"] in link_types and self.items.get(target, {}).get("fields", {}).get("System.WorkItemType") in target_types:
+                    relations.append({"rel": relation["rel"], "source": {"id": source}, "target": {"id": target}})
+        return relations
+
+    # ----------------------------------------------------------- test plans
+    def create_plan(self, name):
+        plan_id = self._new_id()
+        root_id = self._new_id()
+        root = {"id": root_id, "name": name}
+        self.plans[plan_id] = {"id": plan_id, "name": name, "rootSuite": root}
+        self.suites[root_id] = {"id": root_id, "name": name, "plan": plan_id, "parentSuite": None}
+        return self.plans[plan_id]
+
+    def create_suite(self, plan_id, body):
+        suite_id = self._new_id()
+        self.suites[suite_id] = {
+            "id": suite_id,
+            "name": body["name"],
+            "plan": plan_id,
+            "suiteType": body.get("suiteType"),
+            "parentSuite": body.get("parentSuite"),
+        }
+        return self.suites[suite_id]
+
+    def page(self, values, token):
+        start = int(token or 0)
+        end = start + self.config.page_size
+        return values[start:end], (str(end) if end < len(values) else None)
+
+
+def _compare(left, op, right):
+    return {">=": left >= right, ">": left > right, "<=": left <= right, "<": left < right}[op]
+
+
+def _endpoint(method, path):
+    """Stable endpoint label: ids and org/project stripped."""
+    path = re.sub(r"^/[^/]+/[^/]+/_apis/", "/_apis/", path)
+    path = re.sub(r"^/[^/]+/_apis/", "/_apis/", path)
+    path = re.sub(r"/\d+", "/{id}", path)
+    path = re.sub(r"/models/[^/:]+:", "/models/{model}:", path)
+    return f"{method} {path}"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # call counters, throttling and Gemini; also the data of ORG/PROJECT
+    backend = None
+    # "org/project" -> MockBackend with the same configuration, created on first use
+    projects = {}
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # headers and body go out in separate writes; avoid Nagle/delayed-ACK stalls
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    # ----------------------------------------------------------- plumbing
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8") if status != 204 else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method):
+        parsed = urlparse(self.path)
+        path = unquote(parsed.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        body = self._body()
+        backend = self.backend
+
+        if path.startswith("/_mock/"):
+            return self._control(path, body)
+
+        with backend.lock:
+            backend.calls[_endpoint(method, path)] += 1
+
+        wait = backend.take_token()
+        if wait:
+            return self._send(429, {"message": "throttled"}, {
+                "Retry-After": str(max(1, round(wait))),
+                "X-RateLimit-Remaining": "0",
+                "X-RateLimit-Resource": "mock",
+            })
+
+        is_gemini = "/models/" in path
+        time.sleep(backend.gemini_latency() if is_gemini else backend.config.ado_latency)
+
+        headers = {}
+        if backend.config.rate_limit:
+            headers["X-RateLimit-Remaining"] = str(backend.remaining())
+            headers["X-RateLimit-Limit"] = str(backend.config.rate_limit)
+
+        try:
+            if is_gemini:
+                return self._gemini(path, query, body)
+            with backend.lock:
+                status, payload, extra = self._azure(method, path, query, body)
+        except KeyError as e:
+            return self._send(404, {"message": f"not found: {e}"})
+        headers.update(extra)
+        self._send(status, payload, headers)
+
+    def _control(self, path, body):
+        backend = self.backend
+        if path == "/_mock/stats":
+            with backend.lock:
+                return self._send(200, {"calls": dict(backend.calls), "throttled": backend.throttled})
+        if path == "/_mock/reset":
+            MockHandler.backend = MockBackend(MockConfig.from_dict(body or {}))
+            MockHandler.projects = {}
+            return self._send(200, {"ok": True})
+        self._send(404, {"message": "unknown control endpoint"})
+
+    # ----------------------------------------------------------- Azure DevOps
+    def _project_backend(self, path, body):
+        """Backend of the project in the URL (or, for org-level $batch, in the operation URIs)."""
+        org, project = path.strip("/").split("/")[:2]
+        if project == "_apis":
+            project = body[0]["uri"].strip("/").split("/")[0] if body else PROJECT
+        key = f"{org}/{project}"
+        if key == f"{ORG}/{PROJECT}":
+            return self.backend
+        if key not in self.projects:
+            self.projects[key] = MockBackend(self.backend.config)
+        return self.projects[key]
+
+    def _azure(self, method, path, query, body):
+        b = self._project_backend(path, body)
+
+        if path.endswith("/_apis/wit/$batch"):
+            results = []
+            for op in body:
+                target = unquote(op["uri"].split("/workitems/", 1)[1].split("?")[0])
+                if target.startswith("$"):
+                    item = b.create_work_item(target[1:], op["body"])
+                else:
+                    item = b.update_work_item(int(target), op["body"])
+                results.append({"code": 200, "headers": {}, "body": json.dumps(b.view(item["id"]))})
+            return 200, {"count": len(results), "value": results}, {}
+
+        if path.endswith("/_apis/wit/wiql"):
+            try:
+                return 200, b.wiql(body["query"], int(query.get("$top", 0))), {}
+            except ValueError as e:
+                return 400, {"message": str(e)}, {}
+
+        if path.endswith("/_apis/wit/workitemsbatch"):
+            value = [b.view(i, body.get("$expand"), body.get("fields")) if i in b.items else None for i in body["ids"]]
+            return 200, {"count": len(value), "value": value}, {}
+
+        match = re.search(r"/_apis/wit/workitems/\$(.+)$", path)
+        if match and method == "POST":
+            item = b.create_work_item(match.group(1), body)
+            return 200, b.view(item["id"], "relations"), {}
+
+        match = re.search(r"/_apis/wit/workitems/(\d+)$", path)
+        if match:
+            work_id = int(match.group(1))
+            if method == "PATCH":
+                return 200, b.view(b.update_work_item(work_id, body)["id"], "relations"), {}
+            return 200, b.view(work_id, query.get("$expand")), {}
+
+        match = re.search(r"/_apis/testplan/plans/(\d+)/suites/(\d+)/testcase$", path, re.IGNORECASE)
+        if match:
+            plan_id, suite_id = int(match.group(1)), int(match.group(2))
+            if method == "POST":
+                ids = body.get("workItemIds", []) if isinstance(body, dict) else [tc["workItem"]["id"] for tc in body]
+                members = b.suite_cases[suite_id]
+                members.extend(i for i in ids if i not in members)
+                return 200, {"value": [{"workItem": {"id": i}} for i in ids]}, {}
+            if method == "DELETE":
+                ids = {int(i) for i in query.get("testCaseIds", "").split(",") if i}
+                b.suite_cases[suite_id] = [i for i in b.suite_cases[suite_id] if i not in ids]
+                return 204, None, {}
+            page, token = b.page([{"workItem": {"id": i}} for i in b.suite_cases[suite_id]], query.get("continuationToken"))
+            return 200, {"value": page, "count": len(page)}, _token_header(token)
+
+        match = re.search(r"/_apis/testplan/plans/(\d+)/suites$", path, re.IGNORECASE)
+        if match:
+            plan_id = int(match.group(1))
+            if method == "POST":
+                return 200, b.create_suite(plan_id, body), {}
+            suites = [s for s in b.suites.values() if s["plan"] == plan_id]
+            page, token = b.page(suites, query.get("continuationToken"))
+            return 200, {"value": page, "count": len(page)}, _token_header(token)
+
+        match = re.search(r"/_apis/testplan/plans(?:/(\d+))?$", path, re.IGNORECASE)
+        if match:
+            if match.group(1):
+                return 200, b.plans[int(match.group(1))], {}
+            if method == "POST":
+                return 200, b.create_plan(body["name"]), {}
+            page, token = b.page(list(b.plans.values()), query.get("continuationToken"))
+            return 200, {"value": page, "count": len(page)}, _token_header(token)
+
+        return 404, {"message": f"unsupported endpoint {method} {path}"}, {}
+
+    # ----------------------------------------------------------- Gemini
+    def _gemini(self, path, query, body):
+        prompt = body["contents"][0]["parts"][0]["text"]
+        story_ids = re.findall(r"### Story (\d+)", prompt)
+        count = self.backend.config.cases_per_story
+
+        if "responseSchema" not in body.get("generationConfig", {}):
+            return self._send(400, {"error": {"code": 400, "message": "mock expects a responseSchema"}})
+        if story_ids:
+            payload = [{"story_id": sid, "test_cases": _fake_cases(count, sid, self.backend.config.paraphrase_every)}
+                       for sid in story_ids]
+        else:
+            payload = _fake_cases(count, prompt[-40:], self.backend.config.paraphrase_every,
+                                  len(re.findall(r"^\d+\. ", prompt, re.MULTILINE)))
+        text = json.dumps(payload, indent=1)
+        usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4,
+                 "totalTokenCount": (len(prompt) + len(text)) // 4}
+
+        if path.endswith(":streamGenerateContent"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for start in range(0, len(text), 200):
+                event = {"candidates": [{"content": {"parts": [{"text": text[start:start + 200]}]}}]}
+                self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8"))
+            self.wfile.write(f"data: {json.dumps({'usageMetadata': usage})}\r\n\r\n".encode("utf-8"))
+            self.close_connection = True
+            return
+
+        self._send(200, {"candidates": [{"content": {"parts": [{"text": text}]}}], "usageMetadata": usage})
+
+
+_OUTCOMES = ("a confirmation banner appears", "an inline validation error is shown", "the record is saved",
+             "the request is rejected with 403", "the list refreshes", "a retry prompt is offered",
+             "the total is recalculated", "an audit entry is written")
+
+
+def _fake_cases(count, seed, paraphrase_every=0, scenarios=0):
+    kinds = ("positive", "negative", "edge")
+    cases = []
+    for n in range(count):
+        if paraphrase_every and n and n % paraphrase_every == 0:
+            # same case as the previous one with a reworded title
+            previous = cases[-1]
+            cases.append(dict(previous, title="Check that " + previous["title"][0].lower() + previous["title"][1:]))
+            continue
+        feature = _FEATURES[(n * 5 + len(str(seed))) % len(_FEATURES)]
+        given = _INPUTS[(n * 3) % len(_INPUTS)]
+        outcome = _OUTCOMES[(n * 5) % len(_OUTCOMES)]
+        cases.append({
+            "title": f"Verify {feature} with {given} ({seed})".strip(),
+            "type": kinds[n % 3],
+            "scenario": n % scenarios + 1 if scenarios else 1,
+            "steps": [{"action": f"Open the {feature}", "expected": f"The {feature} is shown"},
+                      {"action": f"Enter {given}", "expected": ""},
+                      {"action": "Submit", "expected": outcome[0].upper() + outcome[1:]}],
+        })
+    return cases
+
+
+def _token_header(token):
+    return {"x-ms-continuationtoken": token} if token else {}
+
+
+def start_server(config, port=0):
+    """Starts the mock on a daemon thread; returns (server, base_url)."""
+    MockHandler.backend = MockBackend(config)
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stories", type=int, default=10)
+    parser.add_argument("--ado-latency", type=float, default=0.005)
+    parser.add_argument("--gemini-latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit", type=float, default=0)
+    args = parser.parse_args()
+
+    config = MockConfig(stories=args.stories, ado_latency=args.ado_latency,
+                        gemini_latency=args.gemini_latency, rate_limit=args.rate_limit)
+    server, base_url = start_server(config, args.port)
+    print(f"mock Azure DevOps: {base_url}  (AZURE_ORG={ORG} AZURE_PROJECT={PROJECT})")
+    print(f"mock Gemini:       {base_url}/v1beta")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Benchmarks main.py and the Scripts/ client functions against the local mock.
+
+For every backlog size it resets the mock, runs main.py end to end in a
+fresh process and then times the read path functions in-process, reporting
+wall time, HTTP calls per endpoint and calls per story.
+
+    python -m benchmarks.run_benchmark --sizes 10 100 1000
+    python -m benchmarks.run_benchmark --sizes 100 --max-calls-per-story 3
+    python -m benchmarks.run_benchmark --sizes 5000 --backfill
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from benchmarks.mock_server import ORG, PROJECT, MockConfig, start_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _mock_env(base_url, state_dir):
+    env = dict(os.environ)
+    env.update({
+        "AZURE_BASE_URL": base_url,
+        "GEMINI_BASE_URL": f"{base_url}/v1beta",
+        "AZURE_ORG": ORG,
+        "AZURE_PROJECT": PROJECT,
+        "AZURE_PAT": "mock",
+        "GEMINI_API_KEY": "mock",
+        "GEMINI_CACHE_PATH": os.path.join(state_dir, "gemini_cache.sqlite3"),
+        "SYNC_STATE_PATH": os.path.join(state_dir, "sync_state.json"),
+        "RUN_SUMMARY_PATH": os.path.join(state_dir, "run_summary.json"),
+        "JOURNAL_DIR": os.path.join(state_dir, "journal"),
+        "REGRESSION_INDEX_PATH": os.path.join(state_dir, "regression_index.npz"),
+        "BACKFILL_STATE_DIR": os.path.join(state_dir, "backfill"),
+    })
+    return env
+
+
+def _reset(base_url, config):
+    requests.post(f"{base_url}/_mock/reset", json=config.__dict__, timeout=60).raise_for_status()
+
+
+def _stats(base_url):
+    return requests.get(f"{base_url}/_mock/stats", timeout=10).json()
+
+
+def run_main(base_url, config, extra_env=None, main_args=()):
+    _reset(base_url, config)
+    with tempfile.TemporaryDirectory() as state_dir:
+        env = _mock_env(base_url, state_dir)
+        env.update(extra_env or {})
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, "main.py", *main_args], cwd=REPO_ROOT, env=env,
+                              capture_output=True, text=True)
+        wall = time.perf_counter() - started
+
+        if proc.returncode != 0:
+            raise RuntimeError(f"main.py failed:\n{proc.stdout[-2000:]}\n{proc.stderr[-4000:]}")
+
+        stats = _stats(base_url)
+        with open(env["RUN_SUMMARY_PATH"], encoding="utf-8") as f:
+            summary = json.load(f)
+        # stage timings and Gemini tiers as seen by main.py's own instrumentation
+        stats["stages"] = {name: {k: v for k, v in stage.items() if k != "histogram"}
+                           for name, stage in summary["stages"].items()}
+        stats["gemini_tiers"] = summary.get("gemini_tiers", {})
+        stats["backfill"] = summary.get("backfill")
+    return wall, stats
+
+
+def run_functions(base_url, config):
+    """Times the read path (story fetch + hierarchy resolution) in-process."""
+    from Scripts.azure_client import get_recent_user_stories
+    from Scripts.hierarchy_manager import resolve_hierarchy
+    from Scripts.test_management import plan_suite_index
+    from Scripts.work_item_cache import work_item_cache
+
+    _reset(base_url, config)
+    work_item_cache.clear()
+    plan_suite_index.clear()
+
+    started = time.perf_counter()
+    stories, _ = get_recent_user_stories("2000-01-01T00:00:00.000Z")
+    resolve_hierarchy([story["id"] for story in stories])
+    wall = time.perf_counter() - started
+    return wall, _stats(base_url)
+
+
+def _summarise(name, stories, wall, stats):
+    calls = stats["calls"]
+    total = sum(calls.values())
+    return {
+        "scenario": name,
+        "stories": stories,
+        "wall_seconds": round(wall, 3),
+        "http_calls": total,
+        "calls_per_story": round(total / stories, 2) if stories else 0,
+        "throttled": stats.get("throttled", 0),
+        "calls_per_endpoint": dict(sorted(calls.items(), key=lambda kv: -kv[1])),
+        "stages": stats.get("stages", {}),
+        "gemini_tiers": stats.get("gemini_tiers", {}),
+        "backfill": stats.get("backfill"),
+    }
+
+
+def _print(result):
+    print(f"\n== {result['scenario']} | {result['stories']} stories | {result['wall_seconds']}s | "
+          f"{result['http_calls']} calls ({result['calls_per_story']}/story) | throttled {result['throttled']}")
+    for endpoint, count in result["calls_per_endpoint"].items():
+        print(f"   {count:>7}  {endpoint}")
+    for name, stage in result["stages"].items():
+        print(f"   stage {name}: n={stage['count']} p50={stage['p50']}s p95={stage['p95']}s")
+    for name, tier in result["gemini_tiers"].items():
+        latency = tier["latency"]
+        print(f"   gemini {name} ({tier['model']}): n={tier['calls']} hedged={tier['hedged']} "
+              f"p50={latency['p50']}s p95={latency['p95']}s p99={latency['p99']}s")
+    if result.get("backfill"):
+        backfill = result["backfill"]
+        print(f"   backfill: {backfill['chunks']} chunks, {backfill['stories_per_minute']} stories/min, "
+              f"peak RSS {backfill['peak_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--ado-latency", type=float, default=0.005, help="seconds per Azure DevOps call")
+    parser.add_argument("--gemini-latency", type=float, default=0.05, help="seconds per Gemini call")
+    parser.add_argument("--rate-limit", type=float, default=0, help="mock requests/second, 0 = unlimited")
+    parser.add_argument("--gemini-tail-every", type=int, default=0,
+                        help="every n-th Gemini call is slow (--gemini-tail-latency), 0 = never")
+    parser.add_argument("--gemini-tail-latency", type=float, default=2.0)
+    parser.add_argument("--stories-per-feature", type=int, default=5)
+    parser.add_argument("--features-per-epic", type=int, default=4)
+    parser.add_argument("--backfill", action="store_true",
+                        help="run main.py --backfill over the whole mock project instead of the incremental sync")
+    parser.add_argument("--env", nargs="*", default=[], help="extra KEY=VALUE settings for main.py")
+    parser.add_argument("--output", default=os.path.join(REPO_ROOT, "target", "benchmark.json"))
+    parser.add_argument("--max-calls-per-story", type=float, default=None,
+                        help="fail when main.py exceeds this many HTTP calls per story")
+    args = parser.parse_args()
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    main_args = ["--backfill", "--area-path", PROJECT] if args.backfill else []
+    scenario = " ".join(["main.py", *main_args[:1]])
+    server, base_url = start_server(MockConfig(stories=0))
+
+    # the in-process functions read their configuration at import time
+    os.environ.update(_mock_env(base_url, tempfile.mkdtemp()))
+
+    results = []
+    try:
+        for size in args.sizes:
+            config = MockConfig(stories=size, ado_latency=args.ado_latency, gemini_latency=args.gemini_latency,
+                                rate_limit=args.rate_limit, stories_per_feature=args.stories_per_feature,
+                                features_per_epic=args.features_per_epic,
+                                gemini_tail_every=args.gemini_tail_every,
+                                gemini_tail_latency=args.gemini_tail_latency)
+
+            wall, stats = run_main(base_url, config, extra_env, main_args)
+            results.append(_summarise(scenario, size, wall, stats))
+            _print(results[-1])
+
+            wall, stats = run_functions(base_url, config)
+            results.append(_summarise("read path", size, wall, stats))
+            _print(results[-1])
+    finally:
+        server.shutdown()
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {args.output}")
+
+    if args.max_calls_per_story is not None:
+        worst = max(r["calls_per_story"] for r in results if r["scenario"] == scenario)
+        if worst > args.max_calls_per_story:
+            print(f"FAIL: {worst} calls per story exceeds {args.max_calls_per_story}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+# modules whose names match pytest's test_*.py pattern but hold no tests
+collect_ignore = ["Scripts/test_case_schema.py", "Scripts/test_management.py"]
@@ -1,122 +1,584 @@
+import argparse
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 #Adding them from scripts file
-from Scripts.azure_client import get_recent_user_stories, get_work_item_raw
-from Scripts.hierarchy_manager import get_feature_and_epic,get_related_test_cases
-from Scripts.gemini_client import generate_test_cases
+from Scripts import service_hook
+from Scripts.azure_client import get_recent_user_stories, get_work_items_batch, iter_user_story_chunks, to_story
+from Scripts.backfill import (
+    BACKFILL_CHUNK_SIZE,
+    BACKFILL_PAGE_SIZE,
+    BACKFILL_STATE_DIR,
+    BackfillCheckpoint,
+    BackfillProgress,
+    BackfillScope,
+    prefetch)
+from Scripts.hierarchy_manager import StoryHierarchy, resolve_hierarchy
+from Scripts.instrumentation import metrics
+from Scripts.ac_preprocessor import preprocess_acceptance
+from Scripts.job_journal import JOURNAL_DIR, StoryJournal, prune_journals
+from Scripts.model_router import model_router
+from Scripts.project_context import parse_projects, scoped_path, use_project
+from Scripts.rate_limiter import limiter_stats
+from Scripts.scenario_sync import regenerate_changed_scenarios, scenario_hashes
+from Scripts.regression_index import (
+    REGRESSION_INDEX_REFRESH_SECONDS,
+    REGRESSION_TOP_K,
+    regression_index,
+    sync_regression_index)
+from Scripts.gemini_cache import gemini_cache
+from Scripts.gemini_client import (
+    GEMINI_BATCHING,
+    GEMINI_STREAMING,
+    generate_test_cases,
+    generate_test_cases_batch,
+    generate_test_cases_stream)
+from Scripts.sync_state import SYNC_STATE_PATH, SyncState, parse_ado_date
 from Scripts.test_management import (
     get_or_create_test_plan,
     get_or_create_feature_suite,
     get_or_create_userstory_suite,
     create_regression_suite,
-    Add_TC_to_suite)
-from Scripts.testcase_creator import create_test_cases
+    add_missing_to_suite,
+    reconcile_regression_suite)
+from Scripts.testcase_creator import (
+    close_test_case_work_items,
+    create_test_cases,
+    find_existing_test_cases,
+    remove_tests_from_suite,
+    update_test_case_work_items)
+from Scripts.work_item_cache import work_item_cache
+
+
+# comma separated "org/project" list for multi-project runs; empty = AZURE_ORG/AZURE_PROJECT only
+AZURE_PROJECTS = [p for p in os.getenv("AZURE_PROJECTS", "").split(",") if p.strip()]
+PROJECT_WORKERS = int(os.getenv("PROJECT_WORKERS", "4"))
 
-relevant_test_cases = []
-regression_suite_id = None
-stories = get_recent_user_stories()
 
-t = 0
-for story in stories:
+def process_story(story, hierarchy, regression_targets, pending_generation):
+    """
+    Runs the per-story pipeline with the story's prebuilt hierarchy entry.
+    Returns False when the story is not finished yet: generation was
+    deferred to the batched stage, or existing test cases could not be
+    rewritten or retired (retried on the next run). True otherwise.
+    """
 
-    raw_story = get_work_item_raw(story["id"])
+    raw_story = story["raw"]
 
-    feature, epic = get_feature_and_epic(raw_story)
+    feature, epic, tc_ids = hierarchy
 
     if not feature:
         print("Story missing feature hierarchy")
-        continue
+        return True
 
     if not epic:
         print("Story missing epic hierarchy")
-        continue
+        return True
 
-    tc_ids=(get_related_test_cases(raw_story, relation_type="Related"))
     print("the tc size is "+ str(len(tc_ids)))
-    if len(tc_ids)>0:
-        relevant_test_cases.extend(tc_ids)
-    print("the related tc size is "+ str(len(relevant_test_cases)))
-
-    plan_id,plan_root_suite = get_or_create_test_plan(epic)
-    feature_suite_id = get_or_create_feature_suite(plan_id, feature,plan_root_suite)
-    userstory_suite_id=get_or_create_userstory_suite(plan_id,raw_story,feature_suite_id)
-    if userstory_suite_id == -1:
-        print("the user story test plan already exists and it has test cases generated")
-        continue
-
-    regression_suite_id = create_regression_suite(plan_id,plan_root_suite)
-    print("the regression suite id "+str(regression_suite_id))
-
-
-
-
-#story['id']
-
-# check that the user story doesn't have any TC created Yet
-if not any(rel["attributes"].get("name") == "Tested By" for rel in raw_story['relations']):
-    ai_tests = generate_test_cases(story)
-    create_test_cases(story, ai_tests, plan_id, userstory_suite_id)
-
-if regression_suite_id:
-    for related_test_case in relevant_test_cases:
-        print("the id is "+str(related_test_case["id"]))
-        Add_TC_to_suite(plan_id,regression_suite_id,related_test_case["id"])
-        
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
 
+    with metrics.stage("regression_candidates", story["id"]):
+        candidates = regression_candidates(story, tc_ids)
 
+    with metrics.stage("plan_and_suites", story["id"]):
+        plan_id,plan_root_suite = get_or_create_test_plan(epic)
 
+        if len(tc_ids)>0 or candidates:
+            regression_suite_id = create_regression_suite(plan_id,plan_root_suite)
+            regression_targets.setdefault((plan_id, regression_suite_id), []).extend(
+                [tc["id"] for tc in tc_ids] + candidates)
 
+        feature_suite_id = get_or_create_feature_suite(plan_id, feature,plan_root_suite)
+        userstory_suite_id=get_or_create_userstory_suite(plan_id,raw_story,feature_suite_id)
 
+    journal = StoryJournal.load(story["id"], scoped_path(JOURNAL_DIR))
+    resuming = journal.is_resumable()
 
+    if userstory_suite_id == -1:
+        if journal.stage == "completed" and journal.suite:
+            # generated before; redo only the acceptance criteria scenarios that changed since
+            plan_id, userstory_suite_id = journal.suite
+            if regenerate_changed_scenarios(story, journal):
+                publish_from_journal(story, journal, plan_id, userstory_suite_id)
+            return journal.stage == "completed"
+        if not (resuming and journal.suite):
+            print("the user story test plan already exists and it has test cases generated")
+            return True
+        # a previous run stopped half way through this story
+        plan_id, userstory_suite_id = journal.suite
+        print(f"resuming story {story['id']} from journal stage '{journal.stage}'")
 
+    regression_suite_id = create_regression_suite(plan_id,plan_root_suite)
+    print("the regression suite id "+str(regression_suite_id))
 
+    # check that the user story doesn't have any TC created Yet
+    has_tests = any(rel["attributes"].get("name") == "Tested By" for rel in raw_story.get('relations', []))
+    if has_tests and not resuming:
+        return True
+
+    # journalled only once generation is decided, so a story with hand written
+    # test cases never leaves a resumable journal behind
+    if not resuming or journal.suite != (plan_id, userstory_suite_id):
+        journal.record_suite(plan_id, userstory_suite_id)
+
+    if journal.tests is None:
+        if GEMINI_BATCHING:
+            pending_generation.append((story, plan_id, userstory_suite_id, journal))
+            return False
+
+        if GEMINI_STREAMING:
+            # streamed cases are published while Gemini is still generating the rest
+            # cases an interrupted stream already journaled keep their indexes; the
+            # fresh ones that only repeat them are dropped as near-duplicates
+            streamed = []
+            cases = itertools.chain(journal.streamed, generate_test_cases_stream(story))
+            with metrics.stage("generate_and_publish", story["id"]):
+                created_ids = create_test_cases(story, _collect(cases, streamed), plan_id, userstory_suite_id,
+                                                on_generated=journal.record_streamed, **_journal_hooks(journal))
+            journal.record_generated(streamed, scenario_hashes(story))
+            _finish(story, journal, plan_id, userstory_suite_id, created_ids)
+            return journal.stage == "completed"
+
+        with metrics.stage("generate", story["id"]):
+            journal.record_generated(journal.streamed + generate_test_cases(story), scenario_hashes(story))
+
+    publish_from_journal(story, journal, plan_id, userstory_suite_id, adopt=has_tests)
+    return journal.stage == "completed"
+
+
+def regression_candidates(story, related_test_cases):
+    """
+    Existing test cases most similar to the story according to the local
+    TF-IDF index, besides the ones it already links as Related or Tested By.
+    """
+    known = {tc["id"] for tc in related_test_cases}
+    known.update(
+        int(rel["url"].rstrip("/").split("/")[-1])
+        for rel in story["raw"].get("relations", [])
+        if rel["rel"] == "Microsoft.VSTS.Common.TestedBy-Forward"
+    )
+    text = story["title"] + " " + preprocess_acceptance(story["acceptance"]).text
+    matches = regression_index.top_k(text, exclude=known)
+    if matches:
+        print(f"regression candidates for story {story['id']}: {matches}")
+    metrics.increment("regression_candidates", len(matches))
+    return [test_case_id for test_case_id, _ in matches]
+
+
+def _collect(cases, into):
+    for tc in cases:
+        into.append(tc)
+        yield tc
+
+
+def _journal_hooks(journal):
+    # a case whose existing work item still waits for its rewrite must not be created again
+    created = {**journal.pending_updates, **journal.created}
+    return {
+        "already_created": created,
+        "on_created": journal.record_created,
+        "on_linked": journal.record_linked,
+        # the journal's suite was created by this pipeline; it only holds cases the journal knows about
+        "suite_is_new": not created,
+    }
+
+
+def publish_from_journal(story, journal, plan_id, userstory_suite_id, adopt=False):
+    """
+    Publishes the journal's generated cases, skipping the ones that already
+    exist. With adopt, cases a crashed run created without recording them
+    are found through the story's Tested By links first.
+    """
+    if adopt and isinstance(journal.tests, list):
+        known = {**journal.pending_updates, **journal.created}
+        found = {idx: tc_id for idx, tc_id in find_existing_test_cases(story["id"], journal.tests).items()
+                 if idx not in known}
+        if found:
+            print(f"adopting {len(found)} test cases created by an earlier run for story {story['id']}")
+            journal.record_created(list(found.items()))
+
+    apply_scenario_changes(journal, plan_id, userstory_suite_id)
+
+    with metrics.stage("publish", story["id"]):
+        created_ids = create_test_cases(story, journal.tests, plan_id, userstory_suite_id, **_journal_hooks(journal))
+    _finish(story, journal, plan_id, userstory_suite_id, created_ids)
+
+
+def apply_scenario_changes(journal, plan_id, userstory_suite_id):
+    """
+    Rewrites the existing Test Cases of edited scenarios with their new
+    content and retires (closes and removes from the suite) the ones whose
+    scenario is gone, before the remaining new cases are created.
+    """
+    updates = list(journal.pending_updates.items())
+    if updates:
+        tests = journal.tests
+        results = update_test_case_work_items([(tc_id, tests[idx - 1]) for idx, tc_id in updates])
+        updated = []
+        for (idx, tc_id), result in zip(updates, results):
+            if isinstance(result, Exception):
+                print(f"Failed updating test case {tc_id}: {result}")
+            else:
+                updated.append((idx, tc_id))
+        journal.record_updated(updated)
+        metrics.increment("test_cases_updated", len(updated))
+
+    retire = journal.pending_retire
+    if retire:
+        in_suite = [tc_id for tc_id in retire if tc_id in journal.linked]
+        if in_suite:
+            remove_tests_from_suite(in_suite, plan_id, userstory_suite_id)
+        retired = []
+        for tc_id, result in zip(retire, close_test_case_work_items(retire)):
+            if isinstance(result, Exception):
+                print(f"Failed closing test case {tc_id}: {result}")
+            else:
+                retired.append(tc_id)
+        journal.record_retired(retired)
+        metrics.increment("test_cases_retired", len(retired))
+        print(f"retired test cases {retired} from suite {userstory_suite_id}")
+
+
+def _finish(story, journal, plan_id, userstory_suite_id, created_ids):
+    unlinked = journal.unlinked
+    if unlinked:
+        added = add_missing_to_suite(plan_id, userstory_suite_id, unlinked)
+        journal.record_linked(unlinked)
+        print(f"added {len(added)} previously created test cases to suite {userstory_suite_id}")
+
+    if journal.pending_updates or journal.pending_retire:
+        # left unfinished, so the next run retries them instead of leaving stale cases in the suite
+        print(f"story {story['id']}: {len(journal.pending_updates)} test case updates and "
+              f"{len(journal.pending_retire)} retirements still pending")
+    else:
+        journal.complete()
+    metrics.increment("test_cases_created", len(created_ids))
+    print("created "+str(len(created_ids))+" test cases for story "+str(story["id"]))
+
+
+def run():
+    try:
+        sync_project()
+    finally:
+        # also after a crash, so the pipeline still publishes what the run did
+        write_run_summary()
+
+
+def sync_project():
+    """One incremental sync of the current project (see use_project)."""
+
+    sync_state = SyncState.load(scoped_path(SYNC_STATE_PATH))
+    pruned = prune_journals(scoped_path(JOURNAL_DIR))
+    if pruned:
+        print(f"deleted {pruned} expired story journals")
+
+    # (plan_id, regression_suite_id) -> related test case ids
+    regression_targets = {}
+    # (story, plan_id, userstory_suite_id, journal) waiting for batched generation
+    pending_generation = []
+
+    if REGRESSION_TOP_K:
+        with metrics.stage("regression_index_sync"):
+            changed = sync_regression_index(regression_index)
+        print(f"regression index: {changed} test cases updated, {regression_index.stats()}")
+
+    since = sync_state.since()
+    with metrics.stage("fetch_stories"):
+        stories, as_of = get_recent_user_stories(since)
+    print(f"{len(stories)} user stories changed since {since}")
+
+    to_process = []
+    for story in stories:
+        if sync_state.needs_processing(story["raw"]):
+            to_process.append(story)
+        else:
+            print(f"story {story['id']} already processed at this revision, skipping")
+
+    # Feature, Epic and Related Test Cases for every story in a couple of link queries
+    with metrics.stage("resolve_hierarchy"):
+        hierarchy = resolve_hierarchy([story["id"] for story in to_process])
+
+    for story in to_process:
+        entry = hierarchy.get(story["id"], StoryHierarchy(None, None, []))
+        if process_story(story, entry, regression_targets, pending_generation):
+            sync_state.mark_processed(story["raw"], complete=bool(entry.feature and entry.epic))
+            sync_state.save()
+
+    generate_pending(pending_generation, sync_state)
+    reconcile_regressions(regression_targets)
+
+    # the whole delta up to the query's asOf was handled; the next run only asks
+    # for newer changes (a story fetched with a later edit is simply seen again)
+    if stories:
+        watermark = as_of or stories[-1]["raw"]["fields"].get("System.ChangedDate")
+        # unfinished stories are queried again next run
+        unfinished = [story["raw"]["fields"].get("System.ChangedDate") for story in to_process
+                      if sync_state.needs_processing(story["raw"])]
+        sync_state.advance(min([watermark] + [d for d in unfinished if d], key=parse_ado_date))
+        sync_state.save()
+
+    metrics.increment("stories_fetched", len(stories))
+    metrics.increment("stories_processed", len(to_process))
+
+
+def backfill(scope, chunk_size=BACKFILL_CHUNK_SIZE, restart=False):
+    """
+    Runs every user story in `scope` through the per-story pipeline in id
+    order, chunk_size stories at a time: WIQL ids are paged by id range and
+    each chunk is fetched, resolved, generated and reconciled before the
+    next one (prefetched in the background) takes its place, so memory stays
+    flat however large the scope. A checkpoint after every chunk lets an
+    interrupted backfill resume; stories left unfinished (e.g. a failed
+    rewrite) are retried first on the next run. The incremental sync state
+    is left alone; stories that already have their suite are skipped as in
+    a normal run.
+    """
+    conditions = scope.conditions()
+    if conditions is None:
+        print(f"backfill of {scope.describe()}: no stories in scope")
+        return
+
+    checkpoint = BackfillCheckpoint.load(scope, scoped_path(BACKFILL_STATE_DIR))
+    if restart:
+        checkpoint.clear()
+        checkpoint = BackfillCheckpoint(checkpoint.path)
+    elif checkpoint.last_id:
+        print(f"resuming backfill of {scope.describe()} after story {checkpoint.last_id} "
+              f"({checkpoint.stories} stories done, {len(checkpoint.unfinished)} to retry)")
+
+    # the summary keeps totals; per-story entries would grow with the scope
+    metrics.track_stories = False
+    progress = BackfillProgress(checkpoint.stories)
+
+    if REGRESSION_TOP_K:
+        with metrics.stage("regression_index_sync"):
+            changed = sync_regression_index(regression_index)
+        print(f"regression index: {changed} test cases updated, {regression_index.stats()}")
+
+    retry_ids = set(checkpoint.unfinished)
+    retried = set()
+    retries = [checkpoint.unfinished[i:i + chunk_size] for i in range(0, len(checkpoint.unfinished), chunk_size)]
+    chunks = itertools.chain(
+        ([to_story(raw) for raw in get_work_items_batch(ids, expand="Relations")] for ids in retries),
+        iter_user_story_chunks(conditions, chunk_size, checkpoint.last_id, BACKFILL_PAGE_SIZE,
+                               scope.time_precision))
+    for stories in prefetch(chunks):
+        if not stories:
+            continue
+        started = time.perf_counter()
+        regression_targets = {}
+        pending_generation = []
+        finished = {}
+
+        with metrics.stage("resolve_hierarchy"):
+            hierarchy = resolve_hierarchy([story["id"] for story in stories])
+        for story in stories:
+            entry = hierarchy.get(story["id"], StoryHierarchy(None, None, []))
+            finished[story["id"]] = process_story(story, entry, regression_targets, pending_generation)
+        generate_pending(pending_generation)
+        # deferred stories are done once the batched generation published them
+        for story, _, _, journal in pending_generation:
+            finished[story["id"]] = journal.stage == "completed"
+        reconcile_regressions(regression_targets)
+        retried.update(retry_ids.intersection(finished))
+
+        checkpoint.advance(stories[-1]["id"], [i for i, done in finished.items() if done],
+                           [i for i, done in finished.items() if not done])
+        metrics.increment("stories_fetched", len(stories))
+        metrics.increment("stories_processed", len(stories))
+        progress.chunk_done(len(stories), stories[-1]["id"], time.perf_counter() - started)
+
+    if retry_ids - retried:
+        # unfinished stories deleted since are not fetched any more
+        checkpoint.forget(retry_ids - retried)
+    if checkpoint.unfinished:
+        print(f"backfill of {scope.describe()}: {len(checkpoint.unfinished)} stories unfinished, "
+              f"rerun to retry them")
+    else:
+        checkpoint.clear()
+    print(f"backfill of {scope.describe()} finished: {progress.stats()}")
+    return progress.stats()
+
+
+def run_projects(projects, workers=PROJECT_WORKERS):
+    """
+    Syncs several projects concurrently in one process. They share the HTTP
+    connection pools and the Gemini cache; work item, plan/suite and
+    regression indexes and the on-disk state are kept per project.
+    """
+    def sync(project):
+        with use_project(project):
+            started = time.perf_counter()
+            try:
+                sync_project()
+            finally:
+                metrics.record_project_run(project.key, time.perf_counter() - started)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(projects))),
+                            thread_name_prefix="project") as executor:
+        futures = {executor.submit(sync, project): project for project in projects}
+        failed = []
+        for future in as_completed(futures):
+            project = futures[future]
+            try:
+                future.result()
+                print(f"project {project.key} synced")
+            except Exception as e:
+                failed.append(project.key)
+                print(f"project {project.key} failed: {e}")
+
+    summary = write_run_summary()
+    for key, stats in summary["projects"].items():
+        print(f"{key}: {stats['counters'].get('stories_processed', 0)} stories, "
+              f"{stats['http_calls']} HTTP calls in {stats['wall_seconds']}s")
+    if failed:
+        raise SystemExit(f"{len(failed)} project(s) failed: {', '.join(failed)}")
+
+
+def generate_pending(pending_generation, sync_state=None):
+    if not pending_generation:
+        return
+    with metrics.stage("generate_batch"):
+        batch_tests = generate_test_cases_batch([story for story, _, _, _ in pending_generation])
+    for story, plan_id, userstory_suite_id, journal in pending_generation:
+        journal.record_generated(journal.streamed + batch_tests[story["id"]], scenario_hashes(story))
+        publish_from_journal(story, journal, plan_id, userstory_suite_id)
+        if sync_state is None or journal.stage != "completed":
+            continue
+        with _sync_lock:
+            sync_state.mark_processed(story["raw"])
+            sync_state.save()
+
+
+def reconcile_regressions(regression_targets):
+    for (plan_id, regression_suite_id), related_ids in regression_targets.items():
+        with metrics.stage("regression_reconcile"):
+            added, skipped = reconcile_regression_suite(plan_id, regression_suite_id, related_ids)
+        metrics.increment("regression_added", len(added))
+        metrics.increment("regression_skipped", len(skipped))
+        print(f"regression suite {regression_suite_id} (plan {plan_id}): added {added}, already present {skipped}")
+
+
+def write_run_summary(extra=None):
+    print("work item cache: "+str(work_item_cache.stats()))
+    print("gemini cache: "+str(gemini_cache.stats()))
+    tiers = model_router.stats()
+    for name, tier in tiers.items():
+        latency = tier["latency"]
+        print(f"gemini {name} tier ({tier['model']}): {tier['calls']} calls, {tier['hedged']} hedged, "
+              f"p50={latency['p50']}s p95={latency['p95']}s p99={latency['p99']}s")
+
+    summary = metrics.write_summary(extra={
+        "work_item_cache": work_item_cache.stats(),
+        "gemini_cache": gemini_cache.stats(),
+        "gemini_tiers": tiers,
+        "regression_index": regression_index.stats(),
+        "rate_limits": limiter_stats(),
+        **(extra or {}),
+    })
+    print(f"run summary written: {summary['http_calls']} HTTP calls in {summary['wall_seconds']}s")
+    return summary
+
+
+# ================================
+# SERVICE HOOK MODE
+# ================================
+
+_sync_lock = threading.Lock()
+_epic_locks = defaultdict(threading.Lock)
+_epic_locks_guard = threading.Lock()
+
+
+def _epic_lock(epic):
+    with _epic_locks_guard:
+        return _epic_locks[epic["id"] if epic else None]
+
+
+def handle_story_event(story_id, sync_state):
+    """
+    Processes one story reported by a service hook with the same per-story
+    pipeline as the scheduled run. Called from the receiver's worker threads.
+    """
+    # the event means the story changed; never trust a cached revision
+    work_item_cache.invalidate(story_id)
+    raw = get_work_items_batch([story_id], expand="Relations")
+    if not raw:
+        print(f"story {story_id} not found")
+        return
+    story = to_story(raw[0])
+
+    with _sync_lock:
+        # our own Tested By links also fire workitem.updated; those are skipped here
+        if not sync_state.needs_processing(story["raw"]):
+            print(f"story {story_id} already processed at this revision, skipping")
+            return
+
+    if REGRESSION_TOP_K:
+        sync_regression_index(regression_index, min_interval=REGRESSION_INDEX_REFRESH_SECONDS)
+
+    with metrics.stage("resolve_hierarchy"):
+        entry = resolve_hierarchy([story_id]).get(story_id, StoryHierarchy(None, None, []))
+
+    regression_targets = {}
+    pending_generation = []
+    # stories of one Epic share the plan and suites; creating those is not idempotent
+    with _epic_lock(entry.epic):
+        with metrics.stage("story", story_id):
+            done = process_story(story, entry, regression_targets, pending_generation)
+            generate_pending(pending_generation, sync_state)
+            reconcile_regressions(regression_targets)
+
+    if done:
+        with _sync_lock:
+            sync_state.mark_processed(story["raw"], complete=bool(entry.feature and entry.epic))
+            sync_state.save()
+    metrics.increment("stories_processed")
+
+
+def serve(port, workers):
+    sync_state = SyncState.load(scoped_path(SYNC_STATE_PATH))
+    prune_journals(scoped_path(JOURNAL_DIR))
+    # the receiver runs indefinitely; per-story entries would grow without bound
+    metrics.track_stories = False
+    service_hook.serve(lambda story_id: handle_story_event(story_id, sync_state),
+                       port=port, workers=workers, on_stop=write_run_summary)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI test case generator for Azure DevOps")
+    parser.add_argument("--serve", action="store_true",
+                        help="receive workitem.created/updated service hooks instead of polling once")
+    parser.add_argument("--port", type=int, default=service_hook.SERVICE_HOOK_PORT)
+    parser.add_argument("--workers", type=int, default=service_hook.SERVICE_HOOK_WORKERS)
+    parser.add_argument("--projects", nargs="+", default=AZURE_PROJECTS,
+                        help="sync several 'org/project' (or 'project') entries concurrently")
+    parser.add_argument("--project-workers", type=int, default=PROJECT_WORKERS)
+    parser.add_argument("--backfill", action="store_true",
+                        help="process every story of --epic / --area-path / --created-from..--created-to")
+    parser.add_argument("--epic", type=int)
+    parser.add_argument("--area-path")
+    parser.add_argument("--created-from", help="ISO date or timestamp, inclusive")
+    parser.add_argument("--created-to", help="ISO date or timestamp, exclusive")
+    parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint of an earlier backfill")
+    args = parser.parse_args()
+
+    if args.backfill:
+        scope = BackfillScope(args.epic, args.area_path, args.created_from, args.created_to)
+        if not any(scope):
+            parser.error("--backfill needs --epic, --area-path or --created-from/--created-to")
+        stats = None
+        try:
+            stats = backfill(scope, args.chunk_size, args.restart)
+        finally:
+            write_run_summary({"backfill": stats})
+    elif args.serve:
+        serve(args.port, args.workers)
+    elif args.projects:
+        run_projects(parse_projects(args.projects), args.project_workers)
+    else:
+        run()